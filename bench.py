@@ -0,0 +1,184 @@
+import argparse
+import io
+import os
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+from std_core import get_common_columns, standardize_column_data, write_frames
+from val_core import normalize_frame, generate_validation_report, write_report
+from mrg_core import combine_excel_files
+
+# Benchmarks for the standardise, validate, format and merge stages on synthetic reports.
+# Example: python bench.py --rows 10000 100000 --stages validate format --save baseline.json
+#          python bench.py --rows 10000 100000 --stages validate format --compare baseline.json
+#          python bench.py --cold-start
+
+STAGES = ['standardise', 'validate', 'format', 'merge']
+
+# Stages faster than this in the baseline are too noisy to flag as slower
+MIN_SECONDS = 0.05
+
+APPS = ['val.py', 'std.py', 'mrg.py']
+
+# Run in a fresh interpreter per app: Streamlit is already imported, as in a running server, so the first
+# run pays for the app's own imports and the second is an ordinary rerun
+COLD_START_SCRIPT = '''
+import sys, time
+from streamlit.testing.v1 import AppTest
+app = AppTest.from_file(sys.argv[1], default_timeout=120)
+start = time.perf_counter(); app.run(); first = time.perf_counter() - start
+start = time.perf_counter(); app.run(); rerun = time.perf_counter() - start
+if app.exception:
+    sys.exit(f"{sys.argv[1]} raised: {app.exception[0].value}")
+print(first, rerun)
+'''
+
+def generate_frames(rows, cardinality, measures, mismatch_rate, seed=0):
+    rng = np.random.default_rng(seed)
+    excel_df = pd.DataFrame({
+        'Region': rng.choice([f'Region {i}' for i in range(max(1, cardinality // 10))], rows),
+        'Product': rng.choice([f'Product {i}' for i in range(cardinality)], rows),
+        'Store_ID': rng.integers(0, cardinality, rows),
+        'Date': pd.Timestamp('2024-01-01') + pd.to_timedelta(rng.integers(0, 365, rows), unit='D')
+    })
+    for idx in range(measures):
+        excel_df[f'Measure {idx}'] = rng.normal(1000, 250, rows).round(2)
+
+    # The PBI side is a copy with a share of rows perturbed, so roughly mismatch_rate of the keys differ
+    pbi_df = excel_df.copy()
+    perturbed = rng.random(rows) < mismatch_rate
+    for idx in range(measures):
+        pbi_df.loc[perturbed, f'Measure {idx}'] *= rng.uniform(0.5, 1.5, perturbed.sum())
+    return excel_df, pbi_df
+
+def make_report_files(validation_report, files, sheets):
+    output = write_frames({f'Page {idx}': validation_report for idx in range(sheets)})
+    report_files = []
+    for idx in range(files):
+        report_file = io.BytesIO(output.getvalue())
+        report_file.name = f'Bench_page{idx}_validation_report.xlsx'
+        report_files.append(report_file)
+    return report_files
+
+def time_call(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+def trace_peak(func):
+    # tracemalloc slows allocation-heavy code such as openpyxl several times over, so it gets a run of its own
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1] / 1e6
+    finally:
+        tracemalloc.stop()
+
+def run_stage(stage, excel_df, pbi_df, args):
+    if stage == 'standardise':
+        common_columns = get_common_columns(excel_df, pbi_df)
+        return lambda: standardize_column_data(excel_df.copy(), pbi_df.copy(), common_columns)
+    if stage == 'validate':
+        return lambda: generate_validation_report(normalize_frame(excel_df), normalize_frame(pbi_df), key_mode=args.key_mode)
+    validation_report = generate_validation_report(normalize_frame(excel_df), normalize_frame(pbi_df), key_mode=args.key_mode)[0]
+    if stage == 'format':
+        return lambda: write_report(validation_report, 'Bench', 0.1, 0.5, args.format_mode, args.streaming)
+    if stage == 'merge':
+        report_files = make_report_files(validation_report, args.files, args.sheets)
+        def merge():
+            for report_file in report_files:
+                report_file.seek(0)
+            return combine_excel_files(report_files, 0.1, 0.5, args.format_mode, streaming=args.streaming, max_files=None)
+        return merge
+    raise ValueError(f"Unknown stage: {stage}")
+
+def run_benchmarks(args):
+    results = []
+    for rows in args.rows:
+        excel_df, pbi_df = generate_frames(rows, args.cardinality, args.measures, args.mismatch_rate, args.seed)
+        for stage in args.stages:
+            func = run_stage(stage, excel_df, pbi_df, args)
+            # Best of --repeat runs for time; memory is the same from run to run, so it is traced once
+            seconds = min(time_call(func) for _ in range(args.repeat))
+            peak_mb = trace_peak(func)
+            results.append({'stage': stage, 'rows': rows, 'seconds': round(seconds, 4), 'peak_mb': round(peak_mb, 1)})
+            print(f"{stage:<12} {rows:>10,} rows  {seconds:8.3f} s  {peak_mb:9.1f} MB", flush=True)
+    return results
+
+def measure_cold_start(app, repeat):
+    app_dir = os.path.dirname(os.path.abspath(__file__))
+    runs = []
+    for _ in range(repeat):
+        completed = subprocess.run(
+            [sys.executable, '-c', COLD_START_SCRIPT, app], cwd=app_dir, capture_output=True, text=True, check=True
+        )
+        runs.append([float(value) for value in completed.stdout.split()[-2:]])
+    return {'app': app, 'first_run': round(min(run[0] for run in runs), 3), 'rerun': round(min(run[1] for run in runs), 3)}
+
+def compare_results(results, baseline, tolerance):
+    current = pd.DataFrame(results).set_index(['stage', 'rows'])
+    previous = pd.DataFrame(baseline['results']).set_index(['stage', 'rows'])
+    comparison = current.join(previous, rsuffix='_baseline', how='inner')
+    comparison['time_ratio'] = (comparison['seconds'] / comparison['seconds_baseline']).round(2)
+    comparison['memory_ratio'] = (comparison['peak_mb'] / comparison['peak_mb_baseline']).round(2)
+    slower = (comparison['time_ratio'] > 1 + tolerance) & (comparison['seconds_baseline'] >= MIN_SECONDS)
+    comparison['regressed'] = slower | (comparison['memory_ratio'] > 1 + tolerance)
+    return comparison.reset_index()
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Time and memory-profile each stage on synthetic 'excel'/'PBI' reports.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[1_000, 10_000], help="Row counts to run; several give a scaling curve (default: 1000 10000)")
+    parser.add_argument('--cardinality', type=int, default=500, help="Distinct products and store ids (default: 500)")
+    parser.add_argument('--measures', type=int, default=3, help="Measure columns per sheet (default: 3)")
+    parser.add_argument('--mismatch-rate', type=float, default=0.05, help="Share of rows whose PBI measures are perturbed (default: 0.05)")
+    parser.add_argument('--files', type=int, default=3, help="Report files fed to the merger (default: 3)")
+    parser.add_argument('--sheets', type=int, default=2, help="Sheets per report file fed to the merger (default: 2)")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES, help="Stages to run (default: all)")
+    parser.add_argument('--key-mode', choices=['string', 'tuple', 'hash'], default='string', help="Row matching for the validate stage")
+    parser.add_argument('--format-mode', choices=['cells', 'rules'], default='cells', help="Formatting for the format and merge stages")
+    parser.add_argument('--streaming', action='store_true', help="Use the streaming writers in the format and merge stages")
+    parser.add_argument('--repeat', type=int, default=3, help="Runs per stage; the fastest is kept (default: 3)")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed for the synthetic data")
+    parser.add_argument('--cold-start', action='store_true',
+                        help="Instead of the stages, time each app's first script run in a fresh process and a rerun, with no file uploaded")
+    parser.add_argument('--save', help="Write the results to this JSON file as a baseline")
+    parser.add_argument('--compare', help="Compare against a baseline JSON file and exit 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed slowdown or memory growth over the baseline (default: 0.2)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.cold_start:
+        print(pd.DataFrame([measure_cold_start(app, args.repeat) for app in APPS]).to_string(index=False))
+        return 0
+
+    results = run_benchmarks(args)
+
+    if len(args.rows) > 1:
+        # Seconds per stage at each row count, for the scaling curve
+        print()
+        print(pd.DataFrame(results).pivot(index='rows', columns='stage', values='seconds')[args.stages].to_string())
+
+    if args.save:
+        params = {key: value for key, value in vars(args).items() if key not in ('save', 'compare')}
+        with open(args.save, 'w') as baseline_file:
+            json.dump({'params': params, 'results': results}, baseline_file, indent=2)
+        print(f"\nSaved {len(results)} result(s) -> {args.save}")
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        comparison = compare_results(results, baseline, args.tolerance)
+        print()
+        print(comparison.to_string(index=False))
+        if comparison['regressed'].any():
+            print(f"\nRegression beyond {args.tolerance:.0%} in {int(comparison['regressed'].sum())} stage(s)", file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,189 @@
+import argparse
+import glob
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from openpyxl import load_workbook
+from std_core import get_common_columns, standardize_column_data
+from val_core import (
+    normalize_frame, aggregate_frames, generate_validation_report, generate_diff_checker, generate_diff_summary,
+    get_report_sheet_name, write_reports, read_sheet_chunks, estimate_key_overlap, get_report_columns,
+    generate_rollup_reports, get_rollup_sheet_name, read_validation_sheets
+)
+from mrg_core import combine_excel_files
+
+# Headless batch mode: standardise -> validate -> merge over a directory of workbooks.
+# Example: python cli.py reports/ -o out/ --green-threshold 0.05 --workers 8
+
+def standardise_frames(df_excel, df_pbi):
+    common_columns = get_common_columns(df_excel, df_pbi)
+    df_excel, df_pbi = standardize_column_data(df_excel.copy(), df_pbi.copy(), common_columns)
+
+    # std.py hands its output to val.py through a workbook, which reads text back as plain object columns
+    for df in (df_excel, df_pbi):
+        for col in common_columns:
+            if isinstance(df[col].dtype, (pd.CategoricalDtype, pd.StringDtype)):
+                df[col] = df[col].astype(object)
+    return df_excel, df_pbi
+
+def precheck_workbook(path):
+    # One streamed pass per sheet; nothing is standardised or written
+    wb = load_workbook(path, read_only=True)
+    try:
+        key_summary, measure_summary = estimate_key_overlap(read_sheet_chunks(wb, 'excel'), read_sheet_chunks(wb, 'PBI'))
+    finally:
+        wb.close()
+    summary = {'File': os.path.basename(path)}
+    summary.update(dict(zip(key_summary['Check'], key_summary['Estimate'])))
+    summary.update({f"{measure} total Diff": diff for measure, diff in zip(measure_summary['Measure'], measure_summary['Diff'])})
+    return summary
+
+def validate_workbook(path, output_dir, options):
+    if options['precheck']:
+        return None, precheck_workbook(path)
+
+    excel_df, pbi_df, _, _ = read_validation_sheets(path)
+
+    if options['standardise']:
+        excel_df, pbi_df = standardise_frames(excel_df, pbi_df)
+
+    # Encoded dimensions are normalised value by value inside generate_validation_report
+    if not options['encode_dims']:
+        excel_df = normalize_frame(excel_df)
+        pbi_df = normalize_frame(pbi_df)
+
+    if options['summary_only']:
+        # Gate only: no wide report and no workbook, just pass/fail per measure against the green threshold
+        dims, all_measures, excel_agg, pbi_agg = aggregate_frames(excel_df, pbi_df, options['encode_dims'])
+        diff_summary = generate_diff_summary(excel_agg, pbi_agg, dims, all_measures, options['low_thresh'], options['failure_budget'])
+        summary = {'File': os.path.basename(path)}
+        summary.update(dict(zip(diff_summary['Diff Column Name'], diff_summary['Status'])))
+        summary['Gate'] = 'Pass' if (diff_summary['Status'] == 'Pass').all() else 'Fail'
+        return None, summary
+
+    validation_report, excel_agg, pbi_agg = generate_validation_report(excel_df, pbi_df, key_mode=options['key_mode'],
+                                                                       encode_dims=options['encode_dims'])
+    diff_checker = generate_diff_checker(validation_report)
+
+    reports = {get_report_sheet_name(path): validation_report}
+    if options['rollup']:
+        dims, all_measures = get_report_columns(validation_report)
+        rollups = generate_rollup_reports(excel_agg, pbi_agg, dims, all_measures, options['key_mode'])
+        reports.update({get_rollup_sheet_name(level_dims): report for level_dims, report in rollups.items()})
+
+    original_filename = os.path.splitext(os.path.basename(path))[0]
+    report_path = os.path.join(output_dir, f"{original_filename}_validation_report.xlsx")
+    output = write_reports(reports, options['low_thresh'], options['mid_thresh'], options['format_mode'], options['streaming'])
+    with open(report_path, 'wb') as report_file:
+        report_file.write(output.getvalue())
+
+    summary = {'File': os.path.basename(path), 'Rows': len(validation_report)}
+    summary.update(dict(zip(diff_checker['Diff Column Name'], diff_checker['Percentage Difference'])))
+    return report_path, summary
+
+def find_workbooks(input_dir):
+    # Skip Excel lock files and reports written by an earlier run into the same directory
+    return [path for path in sorted(glob.glob(os.path.join(input_dir, '*.xlsx')))
+            if not os.path.basename(path).startswith('~$') and not path.endswith('_validation_report.xlsx')]
+
+def merge_reports(report_paths, output_dir, options):
+    report_files = [open(path, 'rb') for path in report_paths]
+    try:
+        output_buffer, output_filename = combine_excel_files(
+            report_files, options['low_thresh'], options['mid_thresh'], options['format_mode'],
+            streaming=True, parallel=options['workers'] != 1, max_workers=options['workers'], max_files=None
+        )
+    finally:
+        for report_file in report_files:
+            report_file.close()
+
+    merged_path = os.path.join(output_dir, f"merged_{output_filename}")
+    with open(merged_path, 'wb') as merged_file:
+        merged_file.write(output_buffer.getvalue())
+    return merged_path
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Standardise, validate and merge a directory of 'excel'/'PBI' workbooks without Streamlit.")
+    parser.add_argument('input_dir', help="Directory containing .xlsx workbooks with 'excel' and 'PBI' sheets")
+    parser.add_argument('-o', '--output-dir', help="Where reports are written (default: <input_dir>/validation_reports)")
+    parser.add_argument('--green-threshold', type=float, default=0.1, help="Diff at or below this is green (default: 0.1)")
+    parser.add_argument('--amber-threshold', type=float, default=0.5, help="Diff at or below this is amber (default: 0.5)")
+    parser.add_argument('--key-mode', choices=['string', 'tuple', 'hash'], default='string', help="How rows are matched (default: string)")
+    parser.add_argument('--encode-dims', action='store_true', help="Group on dimensions encoded as shared categories")
+    parser.add_argument('--format-mode', choices=['cells', 'rules'], default='cells', help="Cell fills or Excel conditional-format rules (default: cells)")
+    parser.add_argument('--rollup', action='store_true',
+                        help="Add a report sheet for every dimension prefix level, summed from the full-detail aggregate")
+    parser.add_argument('--summary-only', action='store_true',
+                        help="Only check each measure against the green threshold; write no reports and exit 1 if any check fails")
+    parser.add_argument('--failure-budget', type=int, default=None,
+                        help="With --summary-only, stop checking a workbook once more than this many keys have failed")
+    parser.add_argument('--precheck', action='store_true',
+                        help="Only estimate key overlap and measure totals from sketches in one pass per sheet; write no reports")
+    parser.add_argument('--no-standardise', action='store_true', help="Skip the standardisation step")
+    parser.add_argument('--no-merge', action='store_true', help="Do not merge the reports into one workbook")
+    parser.add_argument('--no-streaming', action='store_true', help="Write reports through pandas instead of the streaming writer")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Worker processes (default: one per CPU)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    output_dir = args.output_dir or os.path.join(args.input_dir, 'validation_reports')
+    os.makedirs(output_dir, exist_ok=True)
+
+    options = {
+        'low_thresh': args.green_threshold,
+        'mid_thresh': args.amber_threshold,
+        'key_mode': args.key_mode,
+        'encode_dims': args.encode_dims,
+        'format_mode': args.format_mode,
+        'summary_only': args.summary_only,
+        'failure_budget': args.failure_budget,
+        'precheck': args.precheck,
+        'rollup': args.rollup,
+        'standardise': not args.no_standardise,
+        'streaming': not args.no_streaming,
+        'workers': args.workers
+    }
+
+    workbooks = find_workbooks(args.input_dir)
+    if not workbooks:
+        print(f"No .xlsx workbooks found in {args.input_dir}", file=sys.stderr)
+        return 1
+
+    report_paths = []
+    summaries = []
+    failures = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        futures = [executor.submit(validate_workbook, path, output_dir, options) for path in workbooks]
+        # Results are collected in input order so the merged sheets follow the file listing
+        for path, future in zip(workbooks, futures):
+            try:
+                report_path, summary = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"FAILED {os.path.basename(path)}: {e}", file=sys.stderr)
+                continue
+            summaries.append(summary)
+            if args.precheck:
+                print(f"Pre-checked {os.path.basename(path)}")
+                continue
+            if args.summary_only:
+                failures += summary['Gate'] == 'Fail'
+                print(f"Checked {os.path.basename(path)}: {summary['Gate']}")
+                continue
+            report_paths.append(report_path)
+            print(f"Validated {os.path.basename(path)} -> {report_path}")
+
+    if summaries:
+        print()
+        print(pd.DataFrame(summaries).to_string(index=False))
+
+    if report_paths and not args.no_merge:
+        merged_path = merge_reports(report_paths, output_dir, options)
+        print(f"\nMerged {len(report_paths)} report(s) -> {merged_path}")
+
+    return 1 if failures else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+import io
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Background jobs shared by the Streamlit apps; nothing here imports Streamlit.
+# Jobs are kept by id in one server-wide store, so a rerun or a reconnecting browser picks up
+# the same job (and its result) instead of starting the work again.
+
+JOB_WORKERS = 2
+
+# Finished jobs beyond this many are dropped, oldest first, when a new job is submitted
+MAX_FINISHED_JOBS = 20
+
+def get_content_hash(files):
+    digest = hashlib.blake2b(digest_size=16)
+    # Each file's position and length go in ahead of its bytes, so moving bytes from one file to
+    # the next, or reordering the files, gives a different hash
+    for position, file in enumerate(files):
+        data = file.getvalue()
+        digest.update(position.to_bytes(8, 'little'))
+        digest.update(len(data).to_bytes(8, 'little'))
+        digest.update(data)
+    return digest.hexdigest()
+
+def copy_uploads(files):
+    # Uploaded files belong to the session that sent them, so jobs get their own in-memory copies
+    copies = []
+    for file in files:
+        copy = io.BytesIO(file.getvalue())
+        copy.name = file.name
+        copies.append(copy)
+    return copies
+
+def create_job_store(max_workers=JOB_WORKERS):
+    return {
+        'executor': ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job'),
+        'jobs': {},
+        'lock': threading.Lock()
+    }
+
+def run_job(job, func, args):
+    def progress(fraction, message=''):
+        job['progress'] = min(max(fraction, 0.0), 1.0)
+        job['message'] = message
+
+    job['status'] = 'running'
+    job['started'] = time.time()
+    try:
+        job['result'] = func(*args, progress=progress)
+        job['status'] = 'done'
+        job['progress'] = 1.0
+    except Exception as e:
+        job['error'] = str(e)
+        job['status'] = 'failed'
+    finally:
+        job['finished'] = time.time()
+
+def prune_jobs(store):
+    finished = sorted(
+        (job for job in store['jobs'].values() if job['finished'] is not None),
+        key=lambda job: job['finished']
+    )
+    for job in finished[:max(len(finished) - MAX_FINISHED_JOBS, 0)]:
+        del store['jobs'][job['id']]
+
+def submit_job(store, job_id, label, func, *args):
+    # The id is derived from the inputs, so resubmitting the same work returns the existing job;
+    # only a failed job is run again, so callers should resubmit one only when the user asks to retry.
+    # func is called as func(*args, progress=callback).
+    with store['lock']:
+        job = store['jobs'].get(job_id)
+        if job is not None and job['status'] != 'failed':
+            return job
+        prune_jobs(store)
+        job = {
+            'id': job_id, 'label': label, 'status': 'queued', 'progress': 0.0, 'message': 'Queued',
+            'result': None, 'error': None, 'submitted': time.time(), 'started': None, 'finished': None
+        }
+        store['jobs'][job_id] = job
+    store['executor'].submit(run_job, job, func, args)
+    return job
+
+def get_job(store, job_id):
+    return store['jobs'].get(job_id)
+
+def is_job_active(job):
+    return job['status'] in ('queued', 'running')
@@ -1,19 +1,24 @@
 import streamlit as st
-import pandas as pd
-import io
 import os
-from openpyxl import Workbook, load_workbook
-from openpyxl.styles import PatternFill
-from openpyxl.utils import get_column_letter
 import base64  # For base64 image encoding
+import importlib.util
 
-# Check for openpyxl availability
-try:
-    from openpyxl import Workbook, load_workbook
-except ImportError:
+# Check for openpyxl availability without importing it; mrg_core loads it once files are uploaded
+if importlib.util.find_spec('openpyxl') is None:
     st.error("The 'openpyxl' library is not installed. Please ensure it's included in your requirements.txt and the environment is set up correctly.")
     st.stop()
 
+from jobs import create_job_store, submit_job, get_job, is_job_active, get_content_hash, copy_uploads
+from profiling import start_profile, stop_profile, profile_stage, get_profile_rows, profile_to_json
+
+FORMAT_MODE_LABELS = {
+    'cells': "Cell fills",
+    'rules': "Excel conditional-format rules"
+}
+
+# How often a running background job's progress bar is refreshed
+JOB_POLL_SECONDS = 1.0
+
 # Custom CSS for styling with improved contrast
 st.markdown("""
     <style>
@@ -69,104 +74,41 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def apply_conditional_formatting(ws, sheet_name, wb, low_thresh, mid_thresh):
-    temp_buffer = io.BytesIO()
-    wb.save(temp_buffer)
-    temp_buffer.seek(0)
-    df = pd.read_excel(temp_buffer, sheet_name=sheet_name)
-
-    dark_green_fill = PatternFill(start_color='19D119', end_color='19D119', fill_type='solid')
-    yellow_fill = PatternFill(start_color='E4E81B', end_color='E4E81B', fill_type='solid')
-    dark_red_fill = PatternFill(start_color='E82D1C', end_color='E82D1C', fill_type='solid')
-
-    diff_cols = [col for col in df.columns if col.endswith('_Diff')]
-    presence_col_idx = df.columns.get_loc('presence') + 1 if 'presence' in df.columns else None
-    
-    for col_idx, col_name in enumerate(df.columns, 1):
-        col_letter = get_column_letter(col_idx)
-        
-        if col_name.endswith('_Diff'):
-            header_cell = ws[f'{col_letter}1']
-            header_cell.number_format = '0.00%'
-            
-            for row_idx, value in enumerate(df[col_name], 2):
-                cell = ws[f'{col_letter}{row_idx}']
-                if pd.notna(value):
-                    cell.value = value
-                    cell.number_format = '0.00%'
-                    if value <= low_thresh:
-                        cell.fill = dark_green_fill
-                    elif value <= mid_thresh:
-                        ratio = (value - low_thresh) / (mid_thresh - low_thresh)
-                        r = int(255 + (139 - 255) * ratio)
-                        g = int(255 - (255 - 0) * ratio)
-                        b = int(0)
-                        color = f'{r:02X}{g:02X}{b:02X}'
-                        cell.fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
-                    else:
-                        cell.fill = dark_red_fill
-        
-        elif presence_col_idx and col_idx == presence_col_idx:
-            for row_idx, value in enumerate(df[col_name], 2):
-                cell = ws[f'{col_letter}{row_idx}']
-                if value == 'Present in Both':
-                    cell.fill = dark_green_fill
-                elif value in ['Present in excel', 'Present in PBI']:
-                    cell.fill = dark_red_fill
-
-def combine_excel_files(file_list):
-    if not file_list or len(file_list) > 10:
-        return None, None
-
-    first_filename = os.path.splitext(file_list[0].name)[0]
-    base_name = first_filename.split('_')[0]
-    output_filename = f"{base_name}_validation_report.xlsx"
-
-    output_buffer = io.BytesIO()
-    output_wb = Workbook()
-    sheet_order = []
-    sheet_name_count = {}
-
-    for uploaded_file in file_list:
-        file_bytes = uploaded_file.read()
-        try:
-            wb = load_workbook(filename=io.BytesIO(file_bytes))
-        except Exception as e:
-            st.error(f"Error reading file {uploaded_file.name}: {str(e)}")
-            return None, None
-
-        for sheet_name in wb.sheetnames:
-            base_sheet_name = sheet_name
-            if sheet_name in sheet_name_count:
-                sheet_name_count[sheet_name] += 1
-                new_sheet_name = f"{base_sheet_name}_{sheet_name_count[sheet_name]}"
-            else:
-                sheet_name_count[sheet_name] = 0
-                new_sheet_name = sheet_name
-
-            ws_source = wb[base_sheet_name]
-            ws_target = output_wb.create_sheet(title=new_sheet_name)
-            for row in ws_source.rows:
-                for cell in row:
-                    ws_target[cell.coordinate].value = cell.value
-            sheet_order.append(new_sheet_name)
-
-    if 'Sheet' in output_wb.sheetnames:
-        output_wb.remove(output_wb['Sheet'])
-    output_wb._sheets = [output_wb[sheet] for sheet in sheet_order]
-
-    for sheet_name in output_wb.sheetnames:
-        apply_conditional_formatting(output_wb[sheet_name], sheet_name, output_wb, low_threshold, mid_threshold)
-
-    output_wb.save(output_buffer)
-    output_buffer.seek(0)
-    return output_buffer, output_filename
-
-# Function to encode local image as base64
+# Function to encode local image as base64, once per server rather than on every rerun
+@st.cache_data(show_spinner=False)
 def get_base64_image(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()
 
+def show_profile(records, source):
+    with st.sidebar.expander("⏱️ Stage timings", expanded=True):
+        if not records:
+            st.caption("Upload files to profile the merge.")
+            return
+        st.caption("Nested stages are indented; their time is included in the stage above them.")
+        st.dataframe(get_profile_rows(records), hide_index=True)
+        st.download_button(
+            label="Export JSON",
+            data=profile_to_json(records, 'mrg', source),
+            file_name=f"{os.path.splitext(source)[0]}_profile.json",
+            mime="application/json",
+            key="download_profile"
+        )
+
+@st.cache_resource
+def get_job_store():
+    # One store for the whole server, so every session sees the jobs by id
+    return create_job_store()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_id):
+    job = get_job(get_job_store(), job_id)
+    if job is None or not is_job_active(job):
+        # Rerun the whole page so the download is rendered below
+        st.rerun()
+    st.progress(job['progress'], text=f"{job['label']}: {job['message']}")
+    st.caption("The job keeps running on the server if you leave; this page's link brings you back to it.")
+
 def main():
     st.markdown('<div class="title">Excel File Merger</div>', unsafe_allow_html=True)
 # Sidebar thresholds
@@ -174,6 +116,37 @@ def main():
     low_threshold = st.sidebar.number_input("Green Threshold (≤)", min_value=0.0, max_value=1.0, value=0.1, step=0.01)
     mid_threshold = st.sidebar.number_input("Amber Threshold (≤)", min_value=0.0, max_value=1.0, value=0.5, step=0.01)
 
+    st.sidebar.header("🎨 Formatting")
+    format_mode = st.sidebar.radio(
+        "Colour the reports with",
+        list(FORMAT_MODE_LABELS),
+        format_func=FORMAT_MODE_LABELS.get,
+        help="Excel rules are written once per column and are much faster to save and open on large reports."
+    )
+    streaming_output = st.sidebar.checkbox(
+        "Streaming writer (large reports)",
+        value=True,
+        help="Writes the merged workbook row by row with styles applied inline, keeping memory flat on very large reports."
+    )
+    parallel_parse = st.sidebar.checkbox(
+        "Parse files in parallel",
+        help="Parses and writes each uploaded workbook in its own process, with only a few files held at once. Sheets are still merged in upload order and always use the streaming writer."
+    )
+
+    st.sidebar.header("🧵 Background Jobs")
+    background_job = st.sidebar.checkbox(
+        "Merge in the background",
+        help="Runs the merge as a server-side job with a progress bar. Reruns and reconnects pick up the same job, and its link lets you download the result again later."
+    )
+
+    st.sidebar.header("⏱️ Profiling")
+    profile_stages = st.sidebar.checkbox(
+        "Profile stages",
+        help="Records each stage's wall time, row count, resident memory at its end and memory growth over it. Parallel merges parse and write in other processes, which are not broken down, and background jobs are not profiled."
+    )
+    stop_profile()
+    records = start_profile() if profile_stages else None
+
     st.markdown("""
     <div class="instructions">
     <h3 style="color: #4682B4;">How to Use:</h3>
@@ -194,6 +167,8 @@ def main():
         key="file_uploader"
     )
 
+    result = None
+    job = None
     if uploaded_files:
         if len(uploaded_files) > 10:
             st.markdown(
@@ -206,21 +181,61 @@ def main():
                 st.markdown(f"- {file.name}", unsafe_allow_html=True)
             st.markdown('</div>', unsafe_allow_html=True)
 
-            with st.spinner("Merging your files... Hang tight!"):
-                result = combine_excel_files(uploaded_files)
-                if result:
-                    output_buffer, output_filename = result
-                    st.markdown(
-                        f'<div class="success-box">Success! Your merged file is ready: <strong>{output_filename}</strong></div>',
-                        unsafe_allow_html=True
-                    )
-                    st.download_button(
-                        label="Download Your Merged Excel!",
-                        data=output_buffer,
-                        file_name=output_filename,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                        key="download_button"
+            from mrg_core import combine_excel_files
+            if background_job:
+                # The job id covers the uploads and the options, so a rerun finds the running job instead of
+                # copying the uploads and submitting them again
+                job_id = f"{get_content_hash(uploaded_files)}-{low_threshold}-{mid_threshold}-{format_mode}-{int(streaming_output)}-{int(parallel_parse)}"
+                job = get_job(get_job_store(), job_id)
+                # A failed job stays failed, with its error shown below, until the user asks for a retry
+                retry = job is not None and job['status'] == 'failed' and st.session_state.get('retry_job', False)
+                if job is None or retry:
+                    job = submit_job(
+                        get_job_store(), job_id, uploaded_files[0].name, combine_excel_files,
+                        copy_uploads(uploaded_files), low_threshold, mid_threshold, format_mode, streaming_output, parallel_parse
                     )
+                st.query_params['job'] = job_id
+            else:
+                with st.spinner("Merging your files... Hang tight!"):
+                    try:
+                        with profile_stage('merge'):
+                            result = combine_excel_files(uploaded_files, low_threshold, mid_threshold, format_mode, streaming_output, parallel_parse)
+                    except ValueError as e:
+                        st.error(str(e))
+                        result = None
+    elif background_job and 'job' in st.query_params:
+        # Back from a reconnect or a shared link: the uploads are gone but the job is still on the server
+        job = get_job(get_job_store(), st.query_params['job'])
+        if job is None:
+            st.warning("That background job is no longer available. Upload the files again to rerun it.")
+
+    if job is not None:
+        if is_job_active(job):
+            show_job_progress(job['id'])
+        elif job['status'] == 'failed':
+            st.error(job['error'])
+            if uploaded_files:
+                st.button("Retry the job", key="retry_job")
+        else:
+            result = job['result']
+
+    if result:
+        output_buffer, output_filename = result
+        st.markdown(
+            f'<div class="success-box">Success! Your merged file is ready: <strong>{output_filename}</strong></div>',
+            unsafe_allow_html=True
+        )
+        st.download_button(
+            label="Download Your Merged Excel!",
+            data=output_buffer,
+            file_name=output_filename,
+            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+            key="download_button"
+        )
+
+    if profile_stages:
+        show_profile(records, uploaded_files[0].name if uploaded_files else 'merge')
+        stop_profile()
 
     # Fancy Footer with Local Image (Sigmoid_Logo.jpg) in Left Upper Corner
     try:
@@ -0,0 +1,285 @@
+import io
+import os
+import shutil
+import zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.differential import DifferentialStyle
+from val_core import (
+    get_combined_report_name, share_strings, make_report_fills, make_palette_fills, get_diff_fill, get_presence_fill,
+    add_conditional_format_rules
+)
+from profiling import profile_stage
+
+# Merge logic shared by the Streamlit app, the batch CLI and the parse workers; nothing here imports Streamlit
+
+def iter_sheet_rows(wb, sheet_name):
+    # Read-only sheets trust the stored <dimension> tag, which some exporters write as just A1;
+    # resetting it makes openpyxl read every row, as a full load or read_excel does
+    ws = wb[sheet_name]
+    ws.reset_dimensions()
+    return ws.iter_rows(values_only=True)
+
+def get_header(ws):
+    return [cell.value if isinstance(cell.value, str) else '' for cell in next(ws.iter_rows(min_row=1, max_row=1), ())]
+
+def is_diff_value(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def apply_conditional_formatting(ws, low_thresh, mid_thresh, mode='cells'):
+    if mode == 'rules':
+        return apply_conditional_formatting_rules(ws, low_thresh, mid_thresh)
+
+    fills = make_report_fills()
+    header = get_header(ws)
+    presence_col_idx = header.index('presence') + 1 if 'presence' in header else None
+    
+    for col_idx, col_name in enumerate(header, 1):
+        if col_name.endswith('_Diff'):
+            ws.cell(row=1, column=col_idx).number_format = '0.00%'
+            
+            # Values come straight from the in-memory sheet, so nothing is saved or re-read
+            for (cell,) in ws.iter_rows(min_row=2, min_col=col_idx, max_col=col_idx):
+                if is_diff_value(cell.value):
+                    cell.number_format = '0.00%'
+                    cell.fill = get_diff_fill(cell.value, low_thresh, mid_thresh, fills)
+        
+        elif presence_col_idx and col_idx == presence_col_idx:
+            for (cell,) in ws.iter_rows(min_row=2, min_col=col_idx, max_col=col_idx):
+                fill = get_presence_fill(cell.value, fills)
+                if fill is not None:
+                    cell.fill = fill
+
+def apply_conditional_formatting_rules(ws, low_thresh, mid_thresh):
+    header = get_header(ws)
+    last_row = ws.max_row
+
+    for col_idx, col_name in enumerate(header, 1):
+        if col_name.endswith('_Diff'):
+            ws.cell(row=1, column=col_idx).number_format = '0.00%'
+            for (cell,) in ws.iter_rows(min_row=2, max_row=last_row, min_col=col_idx, max_col=col_idx):
+                if cell.value is not None:
+                    cell.number_format = '0.00%'
+
+    add_conditional_format_rules(ws, header, last_row, low_thresh, mid_thresh)
+
+def write_sheet_streaming(ws_target, rows, low_thresh, mid_thresh, mode='cells'):
+    # Rows are appended to a write-only sheet with their styles inline, one row in memory at a time
+    fills = make_report_fills()
+    rows = iter(rows)
+    header_values = next(rows, None)
+    if header_values is None:
+        return 0
+
+    header = [value if isinstance(value, str) else '' for value in header_values]
+    diff_idx = [idx for idx, col_name in enumerate(header) if col_name.endswith('_Diff')]
+    presence_idx = header.index('presence') if 'presence' in header else None
+
+    header_row = list(header_values)
+    for col_idx in diff_idx:
+        cell = WriteOnlyCell(ws_target, value=header_row[col_idx])
+        cell.number_format = '0.00%'
+        header_row[col_idx] = cell
+    ws_target.append(header_row)
+
+    last_row = 1
+    for values in rows:
+        row = list(values)
+        for col_idx in diff_idx:
+            if col_idx < len(row) and is_diff_value(row[col_idx]):
+                cell = WriteOnlyCell(ws_target, value=row[col_idx])
+                cell.number_format = '0.00%'
+                if mode == 'cells':
+                    cell.fill = get_diff_fill(row[col_idx], low_thresh, mid_thresh, fills)
+                row[col_idx] = cell
+        if mode == 'cells' and presence_idx is not None and presence_idx < len(row):
+            fill = get_presence_fill(row[presence_idx], fills)
+            if fill is not None:
+                cell = WriteOnlyCell(ws_target, value=row[presence_idx])
+                cell.fill = fill
+                row[presence_idx] = cell
+        ws_target.append(row)
+        last_row += 1
+
+    if mode == 'rules':
+        add_conditional_format_rules(ws_target, header, last_row, low_thresh, mid_thresh)
+    return last_row - 1
+
+def prime_styles(wb):
+    # A workbook numbers cell and rule styles in the order it first meets them. Registering every style the
+    # merge can use up front gives the workers and the parent the same numbering, so a sheet written in a
+    # worker can be dropped into the merged workbook unchanged.
+    if not wb.worksheets:
+        return
+    fills = make_palette_fills()
+    styles = [('0.00%', None)] + [(number_format, fill) for fill in fills.values() for number_format in ['0.00%', 'General']]
+    for number_format, fill in styles:
+        cell = WriteOnlyCell(wb.worksheets[0])
+        cell.number_format = number_format
+        if fill is not None:
+            cell.fill = fill
+        wb._cell_styles.add(cell._style)
+    # The rules mode only ever adds green and red fills as differential styles, green first
+    for name in ['green', 'red']:
+        wb._differential_styles.add(DifferentialStyle(fill=fills[name]))
+
+def write_workbook_sheets(file_bytes, low_thresh, mid_thresh, mode='cells'):
+    # Runs in a worker process: the file's sheets are parsed, styled and serialised here,
+    # and only the compressed workbook goes back to the parent
+    wb = load_workbook(filename=io.BytesIO(file_bytes), read_only=True)
+    try:
+        output_wb = Workbook(write_only=True)
+        targets = [output_wb.create_sheet(title=sheet_name) for sheet_name in wb.sheetnames]
+        prime_styles(output_wb)
+        sheets = [
+            (sheet_name, write_sheet_streaming(ws_target, iter_sheet_rows(wb, sheet_name), low_thresh, mid_thresh, mode))
+            for sheet_name, ws_target in zip(wb.sheetnames, targets)
+        ]
+    finally:
+        wb.close()
+    output_buffer = io.BytesIO()
+    output_wb.save(output_buffer)
+    return sheets, output_buffer.getvalue()
+
+def iter_parallel_writes(file_list, low_thresh, mid_thresh, mode, max_workers=None):
+    # Yields (uploaded file, future) in upload order. A file is only read and submitted once an earlier
+    # result has been taken, so at most one more file than there are workers is held at a time.
+    if max_workers is None:
+        max_workers = min(len(file_list), os.cpu_count() or 1)
+    # spawn rather than fork: the Streamlit server process is multi-threaded
+    executor = ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn'))
+    pending = deque()
+    try:
+        for uploaded_file in file_list:
+            pending.append((uploaded_file, executor.submit(write_workbook_sheets, uploaded_file.read(), low_thresh, mid_thresh, mode)))
+            if len(pending) > max_workers:
+                yield pending.popleft()
+        while pending:
+            yield pending.popleft()
+    finally:
+        executor.shutdown(cancel_futures=True)
+
+def get_unique_sheet_name(sheet_name, sheet_name_count):
+    if sheet_name not in sheet_name_count:
+        sheet_name_count[sheet_name] = 0
+        return sheet_name
+    sheet_name_count[sheet_name] += 1
+    suffix = f"_{sheet_name_count[sheet_name]}"
+    # Excel caps sheet names at 31 characters, so the suffix replaces the end of long names
+    return f"{sheet_name[:31 - len(suffix)]}{suffix}"
+
+def combine_parallel(file_list, low_thresh, mid_thresh, format_mode, max_workers, progress):
+    # Workers hand back finished sheets; the parent only renames them and copies their XML into place
+    output_buffer = io.BytesIO()
+    sheet_order = []
+    sheet_name_count = {}
+    styles = None
+
+    with zipfile.ZipFile(output_buffer, 'w', zipfile.ZIP_DEFLATED, compresslevel=1) as target_zip:
+        for file_idx, (uploaded_file, future) in enumerate(iter_parallel_writes(file_list, low_thresh, mid_thresh, format_mode, max_workers)):
+            try:
+                sheets, workbook_bytes = future.result()
+            except Exception as e:
+                raise ValueError(f"Error reading file {uploaded_file.name}: {str(e)}") from e
+
+            with zipfile.ZipFile(io.BytesIO(workbook_bytes)) as source_zip:
+                # Priming should leave every worker with identical styles; a difference would misnumber cell styles
+                if styles is None:
+                    styles = source_zip.read('xl/styles.xml')
+                elif source_zip.read('xl/styles.xml') != styles:
+                    raise RuntimeError(f"Styles written for {uploaded_file.name} do not match the other files")
+
+                for sheet_idx, (sheet_name, row_count) in enumerate(sheets, 1):
+                    sheet_order.append(get_unique_sheet_name(sheet_name, sheet_name_count))
+                    with profile_stage(f'copy {os.path.basename(uploaded_file.name)} / {sheet_name}') as stage:
+                        with source_zip.open(f'xl/worksheets/sheet{sheet_idx}.xml') as source, \
+                                target_zip.open(f'xl/worksheets/sheet{len(sheet_order)}.xml', 'w') as target:
+                            shutil.copyfileobj(source, target, 1 << 20)
+                        stage['rows'] = row_count
+            if progress is not None:
+                progress((file_idx + 1) / (len(file_list) + 1), f"Merged {os.path.basename(uploaded_file.name)}")
+
+        if progress is not None:
+            progress(len(file_list) / (len(file_list) + 1), "Saving workbook")
+        # The workbook parts come from an empty workbook with the final sheet names and the same primed styles
+        with profile_stage('save workbook'):
+            template_wb = Workbook(write_only=True)
+            for sheet_name in sheet_order:
+                template_wb.create_sheet(title=sheet_name)
+            prime_styles(template_wb)
+            template_buffer = io.BytesIO()
+            template_wb.save(template_buffer)
+            with zipfile.ZipFile(template_buffer) as template_zip:
+                if styles is not None and template_zip.read('xl/styles.xml') != styles:
+                    raise RuntimeError("Styles written by the workers do not match the merged workbook")
+                for name in template_zip.namelist():
+                    if not name.startswith('xl/worksheets/'):
+                        target_zip.writestr(name, template_zip.read(name))
+    output_buffer.seek(0)
+    return output_buffer
+
+def combine_excel_files(file_list, low_thresh, mid_thresh, format_mode='cells', streaming=True, parallel=False, max_workers=None, max_files=10, progress=None):
+    if not file_list or (max_files is not None and len(file_list) > max_files):
+        return None, None
+
+    output_filename = get_combined_report_name(file_list[0].name)
+
+    # Each file is parsed, styled and serialised in its own process, as the streaming writer would;
+    # sheets are still assembled in upload order so the duplicate-name suffixes do not change
+    if parallel:
+        output_buffer = combine_parallel(file_list, low_thresh, mid_thresh, format_mode, max_workers, progress)
+        # Sheets repeat the same keys and presence labels, so the merged file keeps one copy of each string
+        with profile_stage('share strings'):
+            output_buffer = share_strings(output_buffer)
+        return output_buffer, output_filename
+
+    output_buffer = io.BytesIO()
+    output_wb = Workbook(write_only=streaming)
+    sheet_order = []
+    sheet_name_count = {}
+
+    for file_idx, uploaded_file in enumerate(file_list):
+        try:
+            wb = load_workbook(filename=io.BytesIO(uploaded_file.read()), read_only=True)
+            # Read-only sheets hand back plain value tuples, one row at a time
+            sheets = [(sheet_name, iter_sheet_rows(wb, sheet_name)) for sheet_name in wb.sheetnames]
+        except Exception as e:
+            raise ValueError(f"Error reading file {uploaded_file.name}: {str(e)}") from e
+
+        for sheet_name, rows in sheets:
+            new_sheet_name = get_unique_sheet_name(sheet_name, sheet_name_count)
+            ws_target = output_wb.create_sheet(title=new_sheet_name)
+            with profile_stage(f'copy {os.path.basename(uploaded_file.name)} / {sheet_name}') as stage:
+                if streaming:
+                    stage['rows'] = write_sheet_streaming(ws_target, rows, low_thresh, mid_thresh, format_mode)
+                else:
+                    for row in rows:
+                        ws_target.append(row)
+                    stage['rows'] = max(ws_target.max_row - 1, 0)
+            sheet_order.append(new_sheet_name)
+        wb.close()
+        if progress is not None:
+            # Saving is counted as one more step after the files
+            progress((file_idx + 1) / (len(file_list) + 1), f"Merged {os.path.basename(uploaded_file.name)}")
+
+    if not streaming:
+        if 'Sheet' in output_wb.sheetnames:
+            output_wb.remove(output_wb['Sheet'])
+        output_wb._sheets = [output_wb[sheet] for sheet in sheet_order]
+
+        with profile_stage('formatting'):
+            for ws in output_wb.worksheets:
+                apply_conditional_formatting(ws, low_thresh, mid_thresh, format_mode)
+
+    if progress is not None:
+        progress(len(file_list) / (len(file_list) + 1), "Saving workbook")
+    with profile_stage('save workbook'):
+        output_wb.save(output_buffer)
+    output_buffer.seek(0)
+    # Sheets repeat the same keys and presence labels, so the merged file keeps one copy of each string
+    with profile_stage('share strings'):
+        output_buffer = share_strings(output_buffer)
+    return output_buffer, output_filename
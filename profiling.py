@@ -0,0 +1,62 @@
+import os
+import json
+import time
+import contextvars
+from contextlib import contextmanager
+
+# Opt-in per-stage timing shared by the three apps and their core modules; nothing here imports Streamlit.
+# Stages only record while a profile is active in the current thread, so Streamlit sessions do not mix.
+_records = contextvars.ContextVar('profile_records', default=None)
+_depth = contextvars.ContextVar('profile_depth', default=0)
+
+def start_profile():
+    records = []
+    _records.set(records)
+    _depth.set(0)
+    return records
+
+def stop_profile():
+    _records.set(None)
+
+def get_rss_mb():
+    # Current resident memory rather than the process's lifetime peak, so each stage of a long-running
+    # server shows its own footprint; /proc is Linux-only, so elsewhere nothing is recorded
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except (OSError, IndexError, ValueError):
+        return None
+    return round(resident_pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024), 1)
+
+@contextmanager
+def profile_stage(name, rows=None):
+    # Yields the stage's record so the caller can fill in 'rows' once it knows them
+    records = _records.get()
+    record = {'stage': name, 'depth': _depth.get(), 'rows': rows}
+    if records is None:
+        yield record
+        return
+
+    # Appended on entry so nested stages are listed after their parent, in start order
+    records.append(record)
+    token = _depth.set(record['depth'] + 1)
+    start_rss = get_rss_mb()
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        _depth.reset(token)
+        record['seconds'] = round(time.perf_counter() - start, 4)
+        record['rss_mb'] = get_rss_mb()
+        # Growth over the stage; memory freed before the stage ends is not counted
+        if start_rss is not None and record['rss_mb'] is not None:
+            record['rss_growth_mb'] = round(record['rss_mb'] - start_rss, 1)
+        else:
+            record['rss_growth_mb'] = None
+
+def get_profile_rows(records):
+    # Nested stages are indented under their parent, whose time includes theirs
+    return [dict(record, stage='    ' * record['depth'] + record['stage']) for record in records]
+
+def profile_to_json(records, app, source=None):
+    return json.dumps({'app': app, 'source': source, 'stages': records}, indent=2, default=str)
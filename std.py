@@ -1,8 +1,8 @@
 import streamlit as st
-import pandas as pd
 import os
-from io import BytesIO
 import base64 # For base64 image encoding
+from table_io import COLUMNAR_TYPES
+from profiling import start_profile, stop_profile, profile_stage, get_profile_rows, profile_to_json
 # openpyxl is needed for pd.ExcelWriter engine='openpyxl'
 # Although not directly used in the logic shown, ensure it's installed
 # from openpyxl.styles import PatternFill, Font # Not needed for this app's logic
@@ -84,8 +84,8 @@ st.markdown("""
     <div class="instructions">
     <h3 style="color: #4682B4;">How to Use:</h3>
     <ul>
-        <li>Upload an Excel file.</li>
-        <li>Ensure the file contains sheets named "excel" and "PBI".</li>
+        <li>Upload an Excel file, or a pair of Parquet/CSV/Arrow files.</li>
+        <li>Ensure the Excel file contains sheets named "excel" and "PBI".</li>
         <li>Columns common to both sheets will be standardized (numeric, date, or string).</li>
         <li>Download the new Excel file with standardized data.</li>
     </ul>
@@ -93,65 +93,100 @@ st.markdown("""
     """, unsafe_allow_html=True)
 
 
+# -------------------------------
+# Output options
+# -------------------------------
+streaming_output = st.sidebar.checkbox(
+    "Streaming writer (large files)",
+    help="Writes the workbook row by row, keeping memory flat on very large files."
+)
+
+st.sidebar.header("⏱️ Profiling")
+profile_stages = st.sidebar.checkbox(
+    "Profile stages",
+    help="Records each stage's wall time, row count, resident memory at its end and memory growth over it."
+)
+stop_profile()
+records = start_profile() if profile_stages else None
+
+def show_profile(records, source):
+    with st.sidebar.expander("⏱️ Stage timings", expanded=True):
+        if not records:
+            st.caption("Upload a file to profile it.")
+            return
+        st.caption("Nested stages are indented; their time is included in the stage above them.")
+        st.dataframe(get_profile_rows(records), hide_index=True)
+        st.download_button(
+            label="Export JSON",
+            data=profile_to_json(records, 'std', source),
+            file_name=f"{os.path.splitext(source)[0]}_profile.json",
+            mime="application/json",
+            key="download_profile"
+        )
+
 # -------------------------------
 # File Upload
 # -------------------------------
 st.markdown("### 📤 Upload Excel File") # Keep subheader for clarity
-uploaded_file = st.file_uploader(
-    "Upload an Excel file containing sheets named 'excel' and 'PBI'",
-    type=["xlsx"]
+input_format = st.radio(
+    "Input format",
+    ["workbook", "paired"],
+    format_func={'workbook': "Excel workbook", 'paired': "Paired Parquet/CSV/Arrow files"}.get,
+    horizontal=True
 )
 
+if input_format == 'workbook':
+    uploaded_file = st.file_uploader(
+        "Upload an Excel file containing sheets named 'excel' and 'PBI'",
+        type=["xlsx"]
+    )
+    input_files = [uploaded_file] if uploaded_file else []
+else:
+    # Paired inputs are read through pyarrow and written back in their own format
+    excel_file = st.file_uploader("Upload the excel-side file", type=COLUMNAR_TYPES)
+    pbi_file = st.file_uploader("Upload the PBI-side file", type=COLUMNAR_TYPES)
+    input_files = [excel_file, pbi_file] if excel_file and pbi_file else []
+
 # -------------------------------
 # Main Processing
 # -------------------------------
-if uploaded_file:
+if input_files:
     # Indicate uploaded file name using the file-list style
-    st.markdown(f'<div class="file-list"><strong>Uploaded File:</strong> {uploaded_file.name}</div>', unsafe_allow_html=True)
+    uploaded_names = ', '.join(file.name for file in input_files)
+    st.markdown(f'<div class="file-list"><strong>Uploaded File:</strong> {uploaded_names}</div>', unsafe_allow_html=True)
+
+    # pandas and the standardiser are only loaded once there is something to standardise
+    import pandas as pd
+    from std_core import get_common_columns, standardize_column_data, write_frames
+    from table_io import get_table_format, read_table, write_table
 
     with st.spinner("Standardizing your data..."): # Added a spinner similar to the first code
         try:
             # Read sheets
-            xl = pd.ExcelFile(uploaded_file)
-            df_excel = xl.parse('excel')
-            df_pbi = xl.parse('PBI')
+            with profile_stage('read input') as stage:
+                if input_format == 'workbook':
+                    xl = pd.ExcelFile(uploaded_file)
+                    df_excel = xl.parse('excel')
+                    df_pbi = xl.parse('PBI')
+                else:
+                    df_excel = read_table(excel_file)
+                    df_pbi = read_table(pbi_file)
+                stage['rows'] = len(df_excel) + len(df_pbi)
 
             # Common columns
-            common_columns = [col for col in df_excel.columns if col in df_pbi.columns]
-
-            # Standardize function
-            def standardize_column_data(df1, df2, common_columns):
-                for col in common_columns:
-                    # Numeric
-                    if pd.api.types.is_numeric_dtype(df1[col]) and pd.api.types.is_numeric_dtype(df2[col]):
-                        df1[col] = pd.to_numeric(df1[col], errors='coerce')
-                        df2[col] = pd.to_numeric(df2[col], errors='coerce')
-
-                    # Date
-                    elif pd.api.types.is_datetime64_any_dtype(df1[col]) or pd.api.types.is_datetime64_any_dtype(df2[col]):
-                        df1[col] = pd.to_datetime(df1[col], errors='coerce').dt.date
-                        df2[col] = pd.to_datetime(df2[col], errors='coerce').dt.date
-
-                    # String
-                    else:
-                        df1[col] = df1[col].astype(str).str.strip()
-                        df2[col] = df2[col].astype(str).str.strip()
-
-                return df1, df2
+            common_columns = get_common_columns(df_excel, df_pbi)
 
             # Apply standardization
-            df_excel_std, df_pbi_std = standardize_column_data(df_excel.copy(), df_pbi.copy(), common_columns)
+            with profile_stage('standardise', rows=len(df_excel) + len(df_pbi)):
+                df_excel_std, df_pbi_std = standardize_column_data(df_excel.copy(), df_pbi.copy(), common_columns)
 
-            # Output Excel in memory
-            output = BytesIO()
-            with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                df_excel_std.to_excel(writer, sheet_name='excel', index=False)
-                df_pbi_std.to_excel(writer, sheet_name='PBI', index=False)
-            output.seek(0)
+            if input_format == 'workbook':
+                # Output Excel in memory
+                output = write_frames({'excel': df_excel_std, 'PBI': df_pbi_std}, streaming_output)
 
-            # Filename setup
-            original_name = os.path.splitext(uploaded_file.name)[0]
-            output_filename = f"{original_name}_std.xlsx"
+                # Filename setup
+                original_name = os.path.splitext(uploaded_file.name)[0]
+                output_filename = f"{original_name}_std.xlsx"
 
             # Success message using custom styled div
             st.markdown(
@@ -160,12 +195,25 @@ if uploaded_file:
             )
 
             # Download button
-            st.download_button(
-                label="📥 Download Standardized Excel", # Kept original label for clarity
-                data=output,
-                file_name=output_filename,
-                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-            )
+            if input_format == 'workbook':
+                st.download_button(
+                    label="📥 Download Standardized Excel", # Kept original label for clarity
+                    data=output,
+                    file_name=output_filename,
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                )
+            else:
+                for side, source_file, df_std in [('excel', excel_file, df_excel_std), ('PBI', pbi_file, df_pbi_std)]:
+                    original_name, extension = os.path.splitext(source_file.name)
+                    with profile_stage(f'write {side}', rows=len(df_std)):
+                        output = write_table(df_std, get_table_format(source_file.name))
+                    st.download_button(
+                        label=f"📥 Download Standardized {side} File",
+                        data=output,
+                        file_name=f"{original_name}_std{extension}",
+                        mime="application/octet-stream",
+                        key=f"download_{side}"
+                    )
 
         except ValueError as e:
             # Error message using custom styled div
@@ -180,9 +228,14 @@ if uploaded_file:
                  unsafe_allow_html=True
              )
 
+if profile_stages:
+    show_profile(records, input_files[0].name if input_files else 'standardise')
+    stop_profile()
+
 # -------------------------------
 # Footer (Styled like the first code)
-# Function to encode local image as base64 (from the first code)
+# Function to encode local image as base64 (from the first code), cached so reruns skip the file read
+@st.cache_data(show_spinner=False)
 def get_base64_image(image_path):
     try:
         with open(image_path, "rb") as img_file:
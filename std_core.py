@@ -0,0 +1,142 @@
+from io import BytesIO
+import pandas as pd
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Font, Border, Side, Alignment
+from profiling import profile_stage
+
+# Standardisation logic shared by the Streamlit app and the batch CLI; nothing here imports Streamlit
+
+def get_common_columns(df1, df2):
+    return [col for col in df1.columns if col in df2.columns]
+
+# Text columns are held as Arrow-backed strings; those with few distinct values are also dictionary-encoded
+TEXT_DTYPE = pd.StringDtype('pyarrow')
+CATEGORY_RATIO = 0.5
+# Leading rows used to guess whether a text column is worth encoding
+CATEGORY_SAMPLE = 10_000
+
+# Dates keep a datetime64 dtype (normalised to midnight) and are written to Excel in this format
+DATE_FORMAT = 'YYYY-MM-DD'
+
+def standardize_text(values):
+    # Spelled with astype(str) first, as the legacy engine did: None stays 'None' rather than 'nan',
+    # and True and 1, which hash alike, are not factorized into one value
+    values = values.astype(str)
+    sample = values.iloc[:CATEGORY_SAMPLE]
+    if sample.nunique() > len(sample) * CATEGORY_RATIO:
+        # Mostly distinct (ids, free text): strip in Arrow
+        return values.astype(TEXT_DTYPE).str.strip()
+
+    # Few distinct values: strip each one once rather than every cell
+    codes, uniques = pd.factorize(values)
+    labels = pd.Series(uniques, dtype=object).astype(TEXT_DTYPE).str.strip()
+    label_codes, categories = pd.factorize(labels)
+    codes = label_codes[codes]
+
+    if len(categories) <= len(values) * CATEGORY_RATIO:
+        text = pd.Categorical.from_codes(codes, dtype=pd.CategoricalDtype(categories))
+    else:
+        text = categories.take(codes)
+    return pd.Series(text, index=values.index)
+
+def standardize_column_data(df1, df2, common_columns, engine='vectorized'):
+    if engine == 'legacy':
+        return standardize_column_data_legacy(df1, df2, common_columns)
+
+    for col in common_columns:
+        # Numeric
+        if pd.api.types.is_numeric_dtype(df1[col]) and pd.api.types.is_numeric_dtype(df2[col]):
+            df1[col] = pd.to_numeric(df1[col], errors='coerce')
+            df2[col] = pd.to_numeric(df2[col], errors='coerce')
+
+        # Date
+        elif pd.api.types.is_datetime64_any_dtype(df1[col]) or pd.api.types.is_datetime64_any_dtype(df2[col]):
+            df1[col] = pd.to_datetime(df1[col], errors='coerce').dt.normalize()
+            df2[col] = pd.to_datetime(df2[col], errors='coerce').dt.normalize()
+
+        # String: both frames in one pass, so a categorical column shares its categories across them
+        else:
+            text = standardize_text(pd.concat([df1[col], df2[col]], ignore_index=True))
+            df1[col] = text.iloc[:len(df1)].set_axis(df1.index)
+            df2[col] = text.iloc[len(df1):].set_axis(df2.index)
+
+    return df1, df2
+
+def standardize_column_data_legacy(df1, df2, common_columns):
+    for col in common_columns:
+        # Numeric
+        if pd.api.types.is_numeric_dtype(df1[col]) and pd.api.types.is_numeric_dtype(df2[col]):
+            df1[col] = pd.to_numeric(df1[col], errors='coerce')
+            df2[col] = pd.to_numeric(df2[col], errors='coerce')
+
+        # Date
+        elif pd.api.types.is_datetime64_any_dtype(df1[col]) or pd.api.types.is_datetime64_any_dtype(df2[col]):
+            df1[col] = pd.to_datetime(df1[col], errors='coerce').dt.date
+            df2[col] = pd.to_datetime(df2[col], errors='coerce').dt.date
+
+        # String
+        else:
+            df1[col] = df1[col].astype(str).str.strip()
+            df2[col] = df2[col].astype(str).str.strip()
+
+    return df1, df2
+
+def get_date_columns(df):
+    # Datetime columns without a time of day, such as the standardised dates, are written as plain dates
+    return [col for col in df.columns if pd.api.types.is_datetime64_any_dtype(df[col])
+            and (df[col].dropna() == df[col].dropna().dt.normalize()).all()]
+
+# Streaming writer: a write-only workbook serialises each row as it is appended
+def write_frames_streaming(frames):
+    output = BytesIO()
+    wb = Workbook(write_only=True)
+    header_font = Font(bold=True)
+    header_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    header_alignment = Alignment(horizontal='center', vertical='top')
+
+    for sheet_name, df in frames.items():
+        ws = wb.create_sheet(title=sheet_name)
+        header = []
+        for col_name in df.columns:
+            cell = WriteOnlyCell(ws, value=col_name)
+            cell.font = header_font
+            cell.border = header_border
+            cell.alignment = header_alignment
+            header.append(cell)
+        ws.append(header)
+        date_columns = get_date_columns(df)
+        date_positions = [i for i, col in enumerate(df.columns) if col in date_columns]
+        for values in df.itertuples(index=False, name=None):
+            row = [None if pd.isna(value) else value for value in values]
+            for i in date_positions:
+                if row[i] is not None:
+                    row[i] = WriteOnlyCell(ws, value=row[i])
+                    row[i].number_format = DATE_FORMAT
+            ws.append(row)
+
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def write_frames(frames, streaming=False):
+    if streaming:
+        with profile_stage('write streaming', rows=sum(len(df) for df in frames.values())):
+            return write_frames_streaming(frames)
+
+    output = BytesIO()
+    # The parent stage also covers saving the workbook when the writer closes
+    with profile_stage('write workbook', rows=sum(len(df) for df in frames.values())):
+        with pd.ExcelWriter(output, engine='openpyxl') as writer:
+            for sheet_name, df in frames.items():
+                with profile_stage(f'to_excel {sheet_name}', rows=len(df)):
+                    df.to_excel(writer, sheet_name=sheet_name, index=False)
+                # The openpyxl engine ignores ExcelWriter(datetime_format=...), so date columns are formatted here
+                ws = writer.sheets[sheet_name]
+                date_columns = get_date_columns(df)
+                for i, col in enumerate(df.columns, start=1):
+                    if col in date_columns:
+                        for (cell,) in ws.iter_rows(min_row=2, min_col=i, max_col=i):
+                            cell.number_format = DATE_FORMAT
+    output.seek(0)
+    return output
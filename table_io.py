@@ -0,0 +1,109 @@
+import io
+import os
+import re
+
+# Columnar inputs accepted next to .xlsx workbooks, read through pyarrow.
+# pandas and pyarrow are imported inside the readers, so the apps can import COLUMNAR_TYPES
+# for their upload widgets without paying for either until a file arrives.
+COLUMNAR_TYPES = ["parquet", "csv", "arrow", "feather"]
+
+# ISO 8601 dates and timestamps, which pyarrow's CSV reader infers as date and timestamp columns
+ISO_DATETIME = re.compile(r'\d{4}-\d{2}-\d{2}(?:[T ]\d{2}(?::\d{2}(?::\d{2}(?:\.\d{1,9})?)?)?(?:Z|[+-]\d{2}:?\d{2})?)?')
+
+def get_table_format(name):
+    extension = os.path.splitext(name)[1].lower().lstrip('.')
+    if extension == 'feather':
+        return 'arrow'
+    if extension not in COLUMNAR_TYPES:
+        raise ValueError(f"Unsupported file type: {name}")
+    return extension
+
+def get_source_name(source):
+    return source if isinstance(source, str) else source.name
+
+def get_arrow_buffer(source):
+    # Files on disk are memory-mapped; uploads are wrapped without copying their bytes
+    import pyarrow as pa
+    if isinstance(source, str):
+        return pa.memory_map(source)
+    return pa.BufferReader(source.getvalue() if hasattr(source, 'getvalue') else source.read())
+
+def read_arrow_ipc(source):
+    import pyarrow as pa
+    import pyarrow.ipc
+    try:
+        return pa.ipc.open_file(get_arrow_buffer(source)).read_all()
+    except pa.ArrowInvalid:
+        return pa.ipc.open_stream(get_arrow_buffer(source)).read_all()
+
+def read_arrow_table(source):
+    import pyarrow.csv
+    import pyarrow.parquet as pq
+    table_format = get_table_format(get_source_name(source))
+    if table_format == 'parquet':
+        return pq.read_table(source, memory_map=isinstance(source, str))
+    if table_format == 'csv':
+        return pyarrow.csv.read_csv(source)
+    return read_arrow_ipc(source)
+
+def to_frame(table):
+    # Dates become datetime64 columns, as pd.read_excel returns them
+    return table.to_pandas(date_as_object=False)
+
+def read_table(source):
+    return to_frame(read_arrow_table(source))
+
+def parse_iso_datetimes(df):
+    # The C parser leaves dates as strings, which would make them dimensions in chunked mode
+    # but not in memory; convert the columns pyarrow would have read as dates
+    import pandas as pd
+    for col in df.columns[df.dtypes == object]:
+        values = df[col].dropna()
+        if len(values) and values.map(lambda value: isinstance(value, str) and ISO_DATETIME.fullmatch(value) is not None).all():
+            try:
+                df[col] = pd.to_datetime(df[col], format='ISO8601')
+            except (ValueError, TypeError):
+                pass
+    return df
+
+def read_table_chunks(source, chunk_size):
+    import pandas as pd
+    import pyarrow.parquet as pq
+    table_format = get_table_format(get_source_name(source))
+    if table_format == 'csv':
+        # pyarrow's streaming CSV reader fixes each column's type from its first block and fails on a later
+        # int-to-float change, so chunked CSV reads use the C parser with pyarrow's date inference on top
+        for chunk in pd.read_csv(source, chunksize=chunk_size):
+            yield parse_iso_datetimes(chunk)
+        return
+
+    if table_format == 'parquet':
+        parquet_file = pq.ParquetFile(source, memory_map=isinstance(source, str))
+        batches = parquet_file.iter_batches(batch_size=chunk_size)
+        schema = parquet_file.schema_arrow
+    else:
+        table = read_arrow_ipc(source)
+        batches = table.to_batches(max_chunksize=chunk_size)
+        schema = table.schema
+
+    yielded = False
+    for batch in batches:
+        yielded = True
+        yield to_frame(batch)
+    if not yielded:
+        yield to_frame(schema.empty_table())
+
+def write_table(df, table_format):
+    import pyarrow as pa
+    import pyarrow.ipc
+    output = io.BytesIO()
+    if table_format == 'parquet':
+        df.to_parquet(output, engine='pyarrow', index=False)
+    elif table_format == 'csv':
+        df.to_csv(output, index=False)
+    else:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        with pa.ipc.new_file(output, table.schema) as writer:
+            writer.write_table(table)
+    output.seek(0)
+    return output
@@ -0,0 +1,76 @@
+import io
+import re
+import zipfile
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from mrg_core import combine_excel_files
+from val_core import write_report_streaming
+
+ROWS = [('Region', 'Sales'), ('N', 1.0), ('S', 2.0), ('E', 3.0)]
+
+def make_stale_workbook(name):
+    # Some exporters write <dimension ref="A1"/> whatever the sheet holds; read-only openpyxl trusts it
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'excel'
+    for row in ROWS:
+        ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+
+    output = io.BytesIO()
+    with zipfile.ZipFile(io.BytesIO(buffer.getvalue())) as source, zipfile.ZipFile(output, 'w') as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename == 'xl/worksheets/sheet1.xml':
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            target.writestr(item, data)
+    output.seek(0)
+    output.name = name
+    return output
+
+@pytest.mark.parametrize('streaming', [True, False])
+@pytest.mark.parametrize('parallel', [False, True])
+def test_merge_ignores_stale_dimension(streaming, parallel):
+    files = [make_stale_workbook('Retail_page0_validation_report.xlsx'), make_stale_workbook('Retail_page1_validation_report.xlsx')]
+    output, _ = combine_excel_files(files, 0.1, 0.5, streaming=streaming, parallel=parallel, max_workers=2)
+    wb = load_workbook(output)
+    assert wb.sheetnames == ['excel', 'excel_1']
+    for ws in wb.worksheets:
+        assert list(ws.iter_rows(values_only=True)) == ROWS
+
+def read_styled_cells(output):
+    wb = load_workbook(output)
+    cells = [
+        [(cell.value, cell.number_format, cell.fill.fgColor.rgb if cell.fill.fill_type else None) for row in ws.iter_rows() for cell in row]
+        for ws in wb.worksheets
+    ]
+    rules = [
+        [(str(cf.sqref), [(rule.type, rule.formula, rule.dxf.fill.fgColor.rgb if rule.dxf else None) for rule in cf_rules])
+         for cf, cf_rules in ws.conditional_formatting._cf_rules.items()]
+        for ws in wb.worksheets
+    ]
+    return wb.sheetnames, cells, rules
+
+@pytest.mark.parametrize('format_mode', ['cells', 'rules'])
+def test_parallel_matches_serial(format_mode):
+    # Workers style and serialise their own sheets; the merged workbook must read back as the serial one does
+    report = pd.DataFrame({
+        'unique_key': [f'K{idx}' for idx in range(40)],
+        'presence': ['Present in Both', 'Present in excel', 'Present in PBI', 'Present in Both'] * 10,
+        'Sales_Diff': [idx / 50 if idx % 7 else None for idx in range(40)]
+    })
+    files = []
+    for idx in range(3):
+        report_file = write_report_streaming(report, f'report{idx % 2}', 0.1, 0.5, 'cells')
+        report_file.name = f'Retail_page{idx}_validation_report.xlsx'
+        files.append(report_file)
+
+    outputs = []
+    for parallel in [False, True]:
+        for report_file in files:
+            report_file.seek(0)
+        outputs.append(read_styled_cells(combine_excel_files(files, 0.1, 0.5, format_mode, parallel=parallel, max_workers=2)[0]))
+    assert outputs[0][0] == ['report0', 'report1', 'report0_1']
+    assert outputs[1] == outputs[0]
@@ -0,0 +1,204 @@
+import io
+import re
+import zipfile
+import numpy as np
+import pandas as pd
+import pytest
+from openpyxl import Workbook, load_workbook
+from val_core import (
+    generate_validation_report, generate_validation_report_chunked, read_sheet_chunks, read_validation_sheets,
+    normalize_frame, estimate_key_overlap, write_snapshot, read_snapshot, generate_delta_report
+)
+
+# Parity of the join engine with the original dict-lookup engine; rows are compared in unique_key order,
+# as the legacy engine builds its report from a set of keys
+
+def assert_same_report(excel_df, pbi_df):
+    legacy, _, _ = generate_validation_report(excel_df.copy(), pbi_df.copy(), engine='legacy')
+    joined, _, _ = generate_validation_report(excel_df.copy(), pbi_df.copy())
+    assert list(joined.columns) == list(legacy.columns)
+    legacy = legacy.sort_values('unique_key').reset_index(drop=True)
+    joined = joined.sort_values('unique_key').reset_index(drop=True)
+    pd.testing.assert_frame_equal(joined, legacy, check_dtype=False)
+    return joined
+
+def make_frame(rows, seed):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'Region': rng.choice(['N', 'S', 'E-W', None], rows),
+        'Prod_ID': rng.integers(0, 30, rows),
+        'Sales': rng.normal(100, 50, rows).round(2),
+        'Qty': rng.integers(0, 5, rows)
+    })
+
+def test_random_frames():
+    excel_df, pbi_df = make_frame(3000, 1), make_frame(2800, 2)
+    pbi_df.loc[pbi_df.index[:40], 'Region'] = 'X'
+    pbi_df.loc[pbi_df.index[:50], 'Sales'] *= 1.3
+    assert_same_report(excel_df, pbi_df)
+
+def test_one_sided_keys():
+    excel_df = pd.DataFrame({'Region': ['A', 'B', 'C'], 'Sales': [1.0, 2.0, 3.0]})
+    pbi_df = pd.DataFrame({'Region': ['B', 'C', 'D'], 'Sales': [2.0, 4.0, 5.0]})
+    report = assert_same_report(excel_df, pbi_df)
+    assert report['presence'].tolist() == ['Present in excel', 'Present in Both', 'Present in Both', 'Present in PBI']
+
+def test_nan_dimensions():
+    excel_df = pd.DataFrame({'Region': ['A', None, np.nan, 'B'], 'City': ['X', 'Y', None, None], 'Sales': [1.0, 2.0, 3.0, 4.0]})
+    pbi_df = pd.DataFrame({'Region': [None, 'A', 'B'], 'City': [None, 'X', 'Z'], 'Sales': [3.0, 1.0, 4.0]})
+    report = assert_same_report(excel_df, pbi_df)
+    assert 'NAN-NAN' in report['unique_key'].tolist()
+
+@pytest.mark.parametrize('blank_side', ['excel', 'PBI'])
+def test_integer_ids_with_blanks_on_one_side(blank_side):
+    with_ids = pd.DataFrame({'Store_ID': [1, 2, 3], 'Sales': [10.0, 20.0, 30.0]})
+    with_blanks = pd.DataFrame({'Store_ID': [1, 2, None], 'Sales': [10.0, 25.0, 30.0]})
+    if blank_side == 'excel':
+        assert_same_report(with_blanks, with_ids)
+    else:
+        assert_same_report(with_ids, with_blanks)
+
+def test_dash_collisions():
+    # ('A-B', 'C') and ('A', 'B-C') both render as A-B-C; the last row of each side wins, as before
+    excel_df = pd.DataFrame({'Region': ['A-B', 'A', 'D'], 'City': ['C', 'B-C', 'E'], 'Sales': [1.0, 2.0, 3.0]})
+    pbi_df = pd.DataFrame({'Region': ['A', 'D-E'], 'City': ['B-C', 'F'], 'Sales': [2.0, 6.0]})
+    report = assert_same_report(excel_df, pbi_df)
+    assert report['unique_key'].tolist().count('A-B-C') == 1
+
+def make_reports(excel_df, pbi_df):
+    return {
+        key_mode: generate_validation_report(excel_df.copy(), pbi_df.copy(), key_mode=key_mode)[0]
+        for key_mode in ['string', 'tuple', 'hash']
+    }
+
+def test_key_modes_agree_without_collisions():
+    reports = make_reports(make_frame(3000, 1), make_frame(2800, 2))
+    # Hash rows come back in the same order as tuple rows; string rows are in key order
+    pd.testing.assert_frame_equal(reports['hash'], reports['tuple'])
+    by_key = reports['tuple'].sort_values('unique_key').reset_index(drop=True)
+    pd.testing.assert_frame_equal(reports['string'], by_key, check_dtype=False)
+
+def test_hash_matches_tuple_on_mixed_id_dtypes():
+    # Ints on one side and floats with a blank on the other: 1 and 1.0 are one key for tuple and hash
+    excel_df = pd.DataFrame({'Store_ID': [1, 2, 3], 'Sales': [10.0, 20.0, 30.0]})
+    pbi_df = pd.DataFrame({'Store_ID': [1, 2, None], 'Sales': [10.0, 25.0, 30.0]})
+    reports = make_reports(excel_df, pbi_df)
+    pd.testing.assert_frame_equal(reports['hash'], reports['tuple'])
+    assert reports['hash']['presence'].tolist() == ['Present in Both', 'Present in Both', 'Present in excel', 'Present in PBI']
+    # String keys spell each side's value, so 1 and 1.0 stay apart there
+    assert len(reports['string']) == 6
+
+def test_tuple_and_hash_keep_dash_collisions_apart():
+    excel_df = pd.DataFrame({'Region': ['A-B', 'A'], 'City': ['C', 'B-C'], 'Sales': [1.0, 2.0]})
+    pbi_df = pd.DataFrame({'Region': ['A-B', 'A'], 'City': ['C', 'B-C'], 'Sales': [1.0, 2.0]})
+    reports = make_reports(excel_df, pbi_df)
+    assert len(reports['string']) == 1
+    for key_mode in ['tuple', 'hash']:
+        assert reports[key_mode]['presence'].tolist() == ['Present in Both', 'Present in Both']
+        assert reports[key_mode]['unique_key'].tolist() == ['A-B-C', 'A-B-C']
+    pd.testing.assert_frame_equal(reports['hash'], reports['tuple'])
+
+@pytest.mark.parametrize('key_mode', ['string', 'tuple', 'hash'])
+def test_encoded_dimensions_match_object_path(key_mode):
+    # Text dimensions with stray numbers, case and whitespace; ids int on one side and float with a blank on the other
+    excel_df = pd.DataFrame({
+        'Region': ['n', ' N', 'S', 7, None, 'e-w'] * 5,
+        'Store_ID': [1, 2, 3, 1, 2, 3] * 5,
+        'Sales': np.arange(30, dtype=float)
+    })
+    pbi_df = pd.DataFrame({
+        'Region': ['N', 'N', 's ', 7.0, 'E-W', None] * 5,
+        'Store_ID': [1.0, 2.0, None, 1.0, 2.0, 3.0] * 5,
+        'Sales': np.arange(30, dtype=float) * 1.1
+    })
+    plain, _, _ = generate_validation_report(normalize_frame(excel_df), normalize_frame(pbi_df), key_mode=key_mode)
+    encoded, _, _ = generate_validation_report(excel_df.copy(), pbi_df.copy(), key_mode=key_mode, encode_dims=True)
+    plain = plain.sort_values('unique_key').reset_index(drop=True)
+    encoded = encoded.sort_values('unique_key').reset_index(drop=True)
+    pd.testing.assert_frame_equal(encoded, plain, check_dtype=False)
+
+def make_workbook(sheets, stale_dimension=False):
+    # sheets: sheet name -> list of row tuples, header first
+    wb = Workbook()
+    wb.remove(wb.active)
+    for sheet_name, rows in sheets.items():
+        ws = wb.create_sheet(sheet_name)
+        for row in rows:
+            ws.append(row)
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    if not stale_dimension:
+        return buffer.getvalue()
+
+    # Some exporters write <dimension ref="A1"/> whatever the sheet holds; read-only openpyxl trusts it
+    output = io.BytesIO()
+    with zipfile.ZipFile(buffer) as source, zipfile.ZipFile(output, 'w') as target:
+        for item in source.infolist():
+            data = source.read(item.filename)
+            if item.filename.startswith('xl/worksheets/'):
+                data = re.sub(rb'<dimension ref="[^"]*" ?/>', b'<dimension ref="A1"/>', data)
+            target.writestr(item, data)
+    return output.getvalue()
+
+def read_chunks(workbook_bytes, sheet_name, chunk_size):
+    return read_sheet_chunks(load_workbook(io.BytesIO(workbook_bytes), read_only=True), sheet_name, chunk_size)
+
+def test_sheet_chunks_ignore_stale_dimension():
+    rows = [('Region', 'Sales')] + [(f'R{idx}', float(idx)) for idx in range(25)]
+    workbook_bytes = make_workbook({'excel': rows, 'PBI': rows}, stale_dimension=True)
+    chunks = list(read_chunks(workbook_bytes, 'excel', 10))
+    assert [len(chunk) for chunk in chunks] == [10, 10, 5]
+    assert list(chunks[0].columns) == ['Region', 'Sales']
+
+    key_summary, _ = estimate_key_overlap(read_chunks(workbook_bytes, 'excel', 10), read_chunks(workbook_bytes, 'PBI', 10))
+    assert key_summary['Estimate'].tolist()[:2] == [25, 25]
+
+def assert_chunked_matches_in_memory(workbook_bytes, chunk_size):
+    excel_df, pbi_df, _, _ = read_validation_sheets(io.BytesIO(workbook_bytes))
+    in_memory, _, _ = generate_validation_report(normalize_frame(excel_df), normalize_frame(pbi_df))
+    chunked = generate_validation_report_chunked(
+        read_chunks(workbook_bytes, 'excel', chunk_size), read_chunks(workbook_bytes, 'PBI', chunk_size)
+    )[0]
+    assert list(chunked.columns) == list(in_memory.columns)
+    in_memory = in_memory.sort_values('unique_key').reset_index(drop=True)
+    chunked = chunked.sort_values('unique_key').reset_index(drop=True)
+    pd.testing.assert_frame_equal(chunked, in_memory, check_dtype=False)
+    return chunked
+
+def test_chunked_matches_in_memory():
+    rng = np.random.default_rng(3)
+    header = ('Region', 'Store_ID', 'Sales', 'Qty')
+    sheets = {}
+    for sheet_name, rows in [('excel', 450), ('PBI', 420)]:
+        # Store ids are blank now and then, so some chunks read them as float and others as int
+        sheets[sheet_name] = [header] + [
+            (str(rng.choice(['n', 'S ', 'E-W'])), None if idx % 97 == 5 else int(rng.integers(0, 6)),
+             round(float(rng.normal(100, 10)), 2), int(rng.integers(0, 5)))
+            for idx in range(rows)
+        ]
+    assert_chunked_matches_in_memory(make_workbook(sheets), 100)
+
+def test_chunked_measure_blank_in_first_chunk():
+    # Qty is blank for the whole first chunk; it must still be a measure, not a dimension
+    header = ('Region', 'Sales', 'Qty')
+    rows = [header] + [(['A', 'B', 'C'][idx % 3], float(idx), None if idx < 150 else idx % 4) for idx in range(300)]
+    report = assert_chunked_matches_in_memory(make_workbook({'excel': rows, 'PBI': rows}), 100)
+    assert len(report) == 3 and 'Qty_Diff' in report.columns
+
+def make_aggregates(rows):
+    return pd.DataFrame(rows, columns=['Region', 'Sales'])
+
+def test_delta_report_against_snapshot():
+    previous = make_aggregates([('A', 1.0), ('B', 5.0), ('C', 3.0)])
+    snapshot = read_snapshot(write_snapshot(previous, previous, ['Region'], ['Sales']))
+    current = make_aggregates([('A', 1.0), ('B', 6.0), ('D', 2.0)])
+    delta = generate_delta_report(current, current, ['Region'], ['Sales'], snapshot)
+    assert sorted(zip(delta['change'], delta['unique_key'])) == [('Added', 'D'), ('Changed', 'B'), ('Removed', 'C')]
+
+@pytest.mark.parametrize('dims, measures', [(['City'], ['Sales']), (['Region'], ['Sales', 'Qty'])])
+def test_delta_report_rejects_snapshot_of_other_columns(dims, measures):
+    previous = make_aggregates([('A', 1.0), ('B', 5.0)])
+    snapshot = read_snapshot(write_snapshot(previous, previous, ['Region'], ['Sales']))
+    current = pd.DataFrame({'Region': ['A'], 'City': ['X'], 'Sales': [1.0], 'Qty': [2]})
+    with pytest.raises(ValueError, match='Snapshot columns do not match'):
+        generate_delta_report(current, current, dims, measures, snapshot)
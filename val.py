@@ -1,26 +1,35 @@
 import streamlit as st
-import pandas as pd
-import io
-import numpy as np
 import os
-from openpyxl.styles import PatternFill, Font
-from openpyxl.utils import get_column_letter
 import base64  # For base64 image encoding
+from table_io import COLUMNAR_TYPES
+from jobs import create_job_store, submit_job, get_job, is_job_active, get_content_hash, copy_uploads
+from profiling import start_profile, stop_profile, profile_stage, get_profile_rows, profile_to_json
+# val_core (pandas, numpy, openpyxl) is imported where it is used, so a page load without an upload stays light
+
+KEY_MODE_LABELS = {
+    'string': "Joined key (A-B-C)",
+    'tuple': "Dimension values",
+    'hash': "64-bit row hash"
+}
+
+INPUT_FORMAT_LABELS = {
+    'workbook': "Excel workbook",
+    'paired': "Paired Parquet/CSV/Arrow files",
+    'pages': "Several report page workbooks"
+}
 
-# Define the checklist data as a DataFrame
-checklist_data = {
-    "S.No": range(1, 8),
-    "Checklist": [
-        "All the columns of excel replicated in PBI (No extra columns)",
-        "All the filters of excel replicated in PBI",
-        "Filters working as expected (single/multi select as usual)",
-        "Column names matching with excel",
-        "Currency symbols to be replicated",
-        "Pre-applied filters while generating validation report?",
-        "Sorting is replicated"
-    ],
+FORMAT_MODE_LABELS = {
+    'cells': "Cell fills",
+    'rules': "Excel conditional-format rules"
 }
-checklist_df = pd.DataFrame(checklist_data)
+
+PREVIEW_PAGE_SIZES = [50, 100, 500, 1000]
+
+# Distinct uploads (and option combinations) whose parsed frames and reports are kept across reruns
+RESULT_CACHE_ENTRIES = 8
+
+# How often a running background job's progress bar is refreshed
+JOB_POLL_SECONDS = 1.0
 
 # Custom CSS for styling
 st.markdown("""
@@ -77,132 +86,115 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 
-def generate_validation_report(excel_df, pbi_df):
-    dims = [col for col in excel_df.columns if col in pbi_df.columns and 
-            (excel_df[col].dtype == 'object' or '_id' in col.lower() or '_key' in col.lower() or
-             '_ID' in col or '_KEY' in col)]
-
-    excel_df[dims] = excel_df[dims].fillna('NAN')
-    pbi_df[dims] = pbi_df[dims].fillna('NAN')
-
-    excel_measures = [col for col in excel_df.columns if col not in dims and np.issubdtype(excel_df[col].dtype, np.number)]
-    pbi_measures = [col for col in pbi_df.columns if col not in dims and np.issubdtype(pbi_df[col].dtype, np.number)]
-    
-    all_measures = list(set(excel_measures) & set(pbi_measures))
-
-    excel_agg = excel_df.groupby(dims)[all_measures].sum().reset_index()
-    pbi_agg = pbi_df.groupby(dims)[all_measures].sum().reset_index()
-
-    excel_agg['unique_key'] = excel_agg[dims].astype(str).agg('-'.join, axis=1).str.upper()
-    pbi_agg['unique_key'] = pbi_agg[dims].astype(str).agg('-'.join, axis=1).str.upper()
-
-    excel_agg = excel_agg[['unique_key'] + [col for col in excel_agg.columns if col != 'unique_key']]
-    pbi_agg = pbi_agg[['unique_key'] + [col for col in pbi_agg.columns if col != 'unique_key']]
-
-    validation_report = pd.DataFrame({'unique_key': list(set(excel_agg['unique_key']) | set(pbi_agg['unique_key']))})
-
-    for dim in dims:
-        validation_report[dim] = validation_report['unique_key'].map(dict(zip(excel_agg['unique_key'], excel_agg[dim])))
-        validation_report[dim].fillna(validation_report['unique_key'].map(dict(zip(pbi_agg['unique_key'], pbi_agg[dim]))), inplace=True)
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def load_input_frames(content_hash, input_format, _input_files):
+    from val_core import read_input_frames
+    return read_input_frames(input_format, _input_files)
+
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def compute_validation(content_hash, input_format, key_mode, chunked, encode_dims, _input_files):
+    from val_core import run_validation
+    frames = None if chunked else load_input_frames(content_hash, input_format, _input_files)
+    return run_validation(input_format, key_mode, chunked, encode_dims, _input_files, frames)
+
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def compute_pages(content_hash, key_mode, encode_dims, parallel, _input_files):
+    from val_core import run_pages
+    return run_pages(key_mode, encode_dims, parallel, _input_files)
+
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def compute_precheck(content_hash, input_format, _input_files):
+    from val_core import precheck_inputs
+    return precheck_inputs(input_format, _input_files)
+
+def show_precheck(prechecks, low_thresh):
+    st.subheader("Key Pre-check")
+    st.caption("Estimates from one pass over each sheet: distinct keys and overlap come from HyperLogLog and MinHash sketches, so expect a few percent error, more when the overlap is small.")
+    for name, key_summary, measure_summary in prechecks:
+        if len(prechecks) > 1:
+            st.markdown(f"**{name}**")
+        key_col, measure_col = st.columns(2)
+        key_col.dataframe(key_summary, hide_index=True)
+        measure_col.dataframe(
+            measure_summary.style.map(
+                lambda value: 'color: #FF4B4B' if value > low_thresh else '', subset=['Diff']
+            ).format({'Diff': '{:.2%}'}),
+            hide_index=True
+        )
 
-    validation_report['presence'] = validation_report['unique_key'].apply(
-        lambda key: 'Present in Both' if key in excel_agg['unique_key'].values and key in pbi_agg['unique_key'].values
-        else ('Present in excel' if key in excel_agg['unique_key'].values
-              else 'Present in PBI')
+@st.cache_resource
+def get_job_store():
+    # One store for the whole server, so every session sees the jobs by id
+    return create_job_store()
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def show_job_progress(job_id):
+    job = get_job(get_job_store(), job_id)
+    if job is None or not is_job_active(job):
+        # Rerun the whole page so the results are rendered below
+        st.rerun()
+    st.progress(job['progress'], text=f"{job['label']}: {job['message']}")
+    st.caption("The job keeps running on the server if you leave; this page's link brings you back to it.")
+
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def compute_rollups(content_hash, key_mode, chunked, encode_dims, _validation_result):
+    from val_core import get_report_columns, generate_rollup_reports
+    validation_report, _, _, excel_agg, pbi_agg = _validation_result
+    dims, all_measures = get_report_columns(validation_report)
+    # Copies, as the cached aggregates are shared with the snapshot and delta steps
+    return generate_rollup_reports(excel_agg.copy(), pbi_agg.copy(), dims, all_measures, key_mode)
+
+@st.cache_resource(max_entries=RESULT_CACHE_ENTRIES, show_spinner=False)
+def compute_delta(content_hash, snapshot_hash, key_mode, chunked, encode_dims, _validation_result, _snapshot_file):
+    from val_core import get_report_columns, read_snapshot, generate_delta_report
+    validation_report, _, _, excel_agg, pbi_agg = _validation_result
+    dims, all_measures = get_report_columns(validation_report)
+    _snapshot_file.seek(0)
+    delta_report = generate_delta_report(excel_agg, pbi_agg, dims, all_measures, read_snapshot(_snapshot_file), key_mode)
+    return delta_report
+
+def show_preview(validation_report, low_thresh, view=''):
+    from val_core import select_preview_rows, get_preview_page
+    filter_col, order_col, size_col = st.columns(3)
+    non_green_only = filter_col.checkbox("Non-green rows only", help="Rows with a Diff above the green threshold or missing on one side.")
+    mismatches_first = order_col.checkbox("Mismatches first", help="Sorts rows by their largest Diff, highest first.")
+    page_size = size_col.selectbox("Rows per page", PREVIEW_PAGE_SIZES, index=1)
+
+    positions = select_preview_rows(validation_report, low_thresh, non_green_only, mismatches_first)
+    page_count = max(1, -(-len(positions) // page_size))
+    # Keyed on the view so the page resets instead of pointing past the end when the row set changes
+    page = st.number_input(
+        f"Page (of {page_count:,})", min_value=1, max_value=page_count, value=1, step=1,
+        key=f"preview_page_{view}_{non_green_only}_{mismatches_first}_{page_size}"
+    ) - 1
+
+    # Only the visible page is copied and sent to the browser; the percent format is applied client-side
+    page_df = get_preview_page(validation_report, positions, page, page_size).copy()
+    diff_columns = [col for col in page_df.columns if col.endswith('_Diff')]
+    page_df[diff_columns] = page_df[diff_columns] * 100
+    st.dataframe(
+        page_df,
+        column_config={col: st.column_config.NumberColumn(format="%.2f%%") for col in diff_columns}
     )
-
-    for measure in all_measures:
-        validation_report[f'{measure}_excel'] = validation_report['unique_key'].map(dict(zip(excel_agg['unique_key'], excel_agg[measure])))
-        validation_report[f'{measure}_PBI'] = validation_report['unique_key'].map(dict(zip(pbi_agg['unique_key'], pbi_agg[measure])))
-        
-        validation_report[f'{measure}_Diff'] = np.where(
-            (validation_report[f'{measure}_PBI'].fillna(0) == 0) | (validation_report[f'{measure}_excel'].fillna(0) == 0),
-            np.where(
-                (validation_report[f'{measure}_PBI'].fillna(0) == 0) & (validation_report[f'{measure}_excel'].fillna(0) == 0),
-                0,
-                1
-            ),
-            abs(round((validation_report[f'{measure}_PBI'].fillna(0) - validation_report[f'{measure}_excel'].fillna(0)) / 
-                     validation_report[f'{measure}_excel'].fillna(0), 4))
+    st.caption(f"Showing {len(page_df):,} of {len(positions):,} rows ({len(validation_report):,} in the report).")
+
+def show_profile(records, source):
+    with st.sidebar.expander("⏱️ Stage timings", expanded=True):
+        if not records:
+            st.caption("Upload a file to profile it.")
+            return
+        st.caption("Nested stages are indented; their time is included in the stage above them. Cached results skip their stages.")
+        st.dataframe(get_profile_rows(records), hide_index=True)
+        st.download_button(
+            label="Export JSON",
+            data=profile_to_json(records, 'val', source),
+            file_name=f"{os.path.splitext(source)[0]}_profile.json",
+            mime="application/json",
+            key="download_profile"
         )
 
-    column_order = ['unique_key'] + dims + ['presence'] + \
-                   [col for measure in all_measures for col in 
-                    [f'{measure}_excel', f'{measure}_PBI', f'{measure}_Diff']]
-    validation_report = validation_report[column_order]
-
-    return validation_report, excel_agg, pbi_agg
-
-def column_checklist(excel_df, pbi_df):
-    excel_columns = excel_df.columns.tolist()
-    pbi_columns = pbi_df.columns.tolist()
-
-    checklist_df = pd.DataFrame({
-        'excel Columns': excel_columns + [''] * (max(len(pbi_columns), len(excel_columns)) - len(excel_columns)),
-        'PowerBI Columns': pbi_columns + [''] * (max(len(pbi_columns), len(excel_columns)) - len(pbi_columns))
-    })
-
-    checklist_df['Match'] = checklist_df.apply(lambda row: row['excel Columns'] == row['PowerBI Columns'], axis=1)
-    
-    return checklist_df
-
-def generate_diff_checker(validation_report):
-    diff_columns = [col for col in validation_report.columns if col.endswith('_Diff')]
-
-    diff_checker = pd.DataFrame({
-        'Diff Column Name': diff_columns,
-        'Percentage Difference': [f"{validation_report[col].mean()*100:.2f}%" for col in diff_columns]
-    })
-
-    presence_summary = {
-        'Diff Column Name': 'All rows present in both',
-        'Percentage Difference': 'Yes' if all(validation_report['presence'] == 'Present in Both') else 'No'
-    }
-    diff_checker = pd.concat([diff_checker, pd.DataFrame([presence_summary])], ignore_index=True)
-
-    return diff_checker
-
-def apply_conditional_formatting(ws, validation_report, low_thresh, mid_thresh):
-    dark_green_fill = PatternFill(start_color='19D119', end_color='19D119', fill_type='solid')
-    dark_red_fill = PatternFill(start_color='E82D1C', end_color='E82D1C', fill_type='solid')
-
-    diff_cols = [col for col in validation_report.columns if col.endswith('_Diff')]
-    presence_col_idx = validation_report.columns.get_loc('presence') + 1
-    
-    for col_idx, col_name in enumerate(validation_report.columns, 1):
-        col_letter = get_column_letter(col_idx)
-        
-        if col_name.endswith('_Diff'):
-            header_cell = ws[f'{col_letter}1']
-            header_cell.number_format = '0.00%'
-            
-            for row_idx, value in enumerate(validation_report[col_name], 2):
-                cell = ws[f'{col_letter}{row_idx}']
-                if pd.notna(value):
-                    cell.value = value
-                    cell.number_format = '0.00%'
-                    
-                    if value <= low_thresh:
-                        cell.fill = dark_green_fill
-                    elif value <= mid_thresh:
-                        ratio = (value - low_thresh) / (mid_thresh - low_thresh)
-                        r = int(255 + (139 - 255) * ratio)
-                        g = int(255 - (255 - 0) * ratio)
-                        b = 0
-                        color = f'{r:02X}{g:02X}{b:02X}'
-                        cell.fill = PatternFill(start_color=color, end_color=color, fill_type='solid')
-                    else:
-                        cell.fill = dark_red_fill
-        
-        elif col_idx == presence_col_idx:
-            for row_idx, value in enumerate(validation_report[col_name], 2):
-                cell = ws[f'{col_letter}{row_idx}']
-                if value == 'Present in Both':
-                    cell.fill = dark_green_fill
-                elif value in ['Present in excel', 'Present in PBI']:
-                    cell.fill = dark_red_fill
-
-# Function to encode local image as base64
+# Function to encode local image as base64, once per server rather than on every rerun
+@st.cache_data(show_spinner=False)
 def get_base64_image(image_path):
     with open(image_path, "rb") as img_file:
         return base64.b64encode(img_file.read()).decode()
@@ -215,77 +207,315 @@ def main():
     low_threshold = st.sidebar.number_input("Green Threshold (≤)", min_value=0.0, max_value=1.0, value=0.1, step=0.01)
     mid_threshold = st.sidebar.number_input("Amber Threshold (≤)", min_value=0.0, max_value=1.0, value=0.5, step=0.01)
 
+    st.sidebar.header("🔑 Row Matching")
+    key_mode = st.sidebar.selectbox(
+        "Match rows on",
+        list(KEY_MODE_LABELS),
+        format_func=KEY_MODE_LABELS.get,
+        help="Joined key matches the classic 'A-B-C' text key. Dimension values and the row hash skip building that text for every row."
+    )
+
+    encode_dims = st.sidebar.checkbox(
+        "Encode dimensions as categories",
+        help="Normalises each distinct dimension value once and groups both sheets on shared category codes. Much faster on repetitive dimensions such as region or product. Not used with chunked aggregation."
+    )
+
+    key_precheck = st.sidebar.checkbox(
+        "Quick key pre-check only",
+        help="Estimates key overlap and measure totals from compact sketches in one pass over each sheet, without building the full report. Use it to spot a wrong filter or a missing page first."
+    )
+
+    rollup_levels = st.sidebar.checkbox(
+        "Roll up every dimension level",
+        help="Adds a report sheet per dimension prefix (e.g. Region, then Region > Product), summed from the full-detail aggregate, to find which slice drives a mismatch. Single reports only."
+    )
+
+    chunked_aggregation = st.sidebar.checkbox(
+        "Chunked aggregation (large files)",
+        help="Reads both sheets 100,000 rows at a time and keeps only running per-key sums in memory."
+    )
+
+    parallel_pages = st.sidebar.checkbox(
+        "Validate pages in parallel",
+        help="With several report page workbooks, validates each page in its own process. Pages are always read whole, so chunked aggregation does not apply to them."
+    )
+
+    st.sidebar.header("🎨 Formatting")
+    format_mode = st.sidebar.radio(
+        "Colour the report with",
+        list(FORMAT_MODE_LABELS),
+        format_func=FORMAT_MODE_LABELS.get,
+        help="Excel rules are written once per column and are much faster to save and open on large reports."
+    )
+    streaming_output = st.sidebar.checkbox(
+        "Streaming writer (large reports)",
+        help="Writes the workbook row by row with styles applied inline, keeping memory flat on very large reports."
+    )
+
+    st.sidebar.header("🧵 Background Jobs")
+    background_job = st.sidebar.checkbox(
+        "Run validation in the background",
+        help="Runs the validation as a server-side job with a progress bar. Reruns and reconnects pick up the same job, and its link lets you download the result again later."
+    )
+
+    st.sidebar.header("⏱️ Profiling")
+    profile_stages = st.sidebar.checkbox(
+        "Profile stages",
+        help="Records each stage's wall time, row count, resident memory at its end and memory growth over it. Background jobs are not profiled."
+    )
+    stop_profile()
+    records = start_profile() if profile_stages else None
+
     st.markdown("""
     <div class="instructions">
     <h3 style="color: #4682B4;">How to Use:</h3>
     <ul>
-        <li>Upload an Excel file with two sheets: "excel" and "PBI".</li>
+        <li>Upload an Excel file with two sheets: "excel" and "PBI", or a pair of Parquet/CSV/Arrow files.</li>
         <li>Ensure column names are similar in both sheets for accurate comparison.</li>
         <li>For ID/Key/Code columns, include "_ID" or "_KEY" in the names (case insensitive).</li>
+        <li>For a report with several pages, upload every page workbook at once to get one combined report.</li>
         <li>Preview your validation report and download the formatted Excel file!</li>
     </ul>
     </div>
     """, unsafe_allow_html=True)
 
-    uploaded_file = st.file_uploader(
-        "Drop Your Excel File Here!",
-        type=["xls","xlsx"],
-        help="Upload an Excel file with 'excel' and 'PBI' sheets."
+    input_format = st.radio(
+        "Input format",
+        list(INPUT_FORMAT_LABELS),
+        format_func=INPUT_FORMAT_LABELS.get,
+        horizontal=True
     )
 
-    if uploaded_file is not None:
-        st.markdown(f'<div class="file-list"><strong>Uploaded File:</strong> {uploaded_file.name}</div>', unsafe_allow_html=True)
-        
-        with st.spinner("Generating your validation report... Hang tight!"):
-            try:
-                xls = pd.ExcelFile(uploaded_file)
-                excel_df = pd.read_excel(xls, 'excel')
-                pbi_df = pd.read_excel(xls, 'PBI')
-
-                excel_df = excel_df.apply(lambda x: x.str.upper().str.strip() if x.dtype == "object" else x)
-                pbi_df = pbi_df.apply(lambda x: x.str.upper().str.strip() if x.dtype == "object" else x)
-
-                validation_report, excel_agg, pbi_agg = generate_validation_report(excel_df, pbi_df)
-                column_checklist_df = column_checklist(excel_df, pbi_df)
-                diff_checker_df = generate_diff_checker(validation_report)
-
-                st.subheader("Validation Report Preview")
-                display_report = validation_report.copy()
-                for col in display_report.columns:
-                    if col.endswith('_Diff'):
-                        display_report[col] = display_report[col].apply(lambda x: f"{x*100:.2f}%" if pd.notna(x) else x)
-                st.dataframe(display_report)
-
-                output = io.BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    original_filename = os.path.splitext(uploaded_file.name)[0]
-                    sheet_name = f"{original_filename}_validation_report"
-                    if len(sheet_name) > 31:
-                        sheet_name = sheet_name[:31]
-                    validation_report.to_excel(writer, sheet_name=sheet_name, index=False)
-                    ws = writer.sheets[sheet_name]
-                    apply_conditional_formatting(ws, validation_report, low_threshold, mid_threshold)
-
-                output.seek(0)
-                new_file_name = f"{original_filename}_validation_report.xlsx"
-                st.markdown(
-                    f'<div class="success-box">Success! Your validation report is ready: <strong>{new_file_name}</strong></div>',
-                    unsafe_allow_html=True
-                )
-                st.download_button(
-                    label="Download Your Validation Report!",
-                    data=output,
-                    file_name=new_file_name,
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
-
-                st.markdown('---')
-
-            except Exception as e:
-                st.markdown(
-                    f'<div class="error-box">Oops! An error occurred: {str(e)}</div>',
-                    unsafe_allow_html=True
-                )
+    if input_format == 'workbook':
+        uploaded_file = st.file_uploader(
+            "Drop Your Excel File Here!",
+            type=["xls","xlsx"],
+            help="Upload an Excel file with 'excel' and 'PBI' sheets."
+        )
+        input_files = [uploaded_file] if uploaded_file is not None else []
+    elif input_format == 'pages':
+        page_files = st.file_uploader(
+            "Drop Your Report Page Workbooks Here!",
+            type=["xls","xlsx"],
+            accept_multiple_files=True,
+            help="One workbook per report page, each with 'excel' and 'PBI' sheets. Every page is validated and written into one combined report, in upload order."
+        )
+        # The combined report is named after the first page, as the merger does
+        uploaded_file = page_files[0] if page_files else None
+        input_files = page_files or []
+    else:
+        excel_file = st.file_uploader(
+            "Drop Your excel-side File Here!",
+            type=COLUMNAR_TYPES,
+            help="Parquet, CSV or Arrow IPC file holding the excel data."
+        )
+        pbi_file = st.file_uploader(
+            "Drop Your PBI-side File Here!",
+            type=COLUMNAR_TYPES,
+            help="Parquet, CSV or Arrow IPC file holding the PBI data."
+        )
+        # The report is named after the excel-side file
+        uploaded_file = excel_file
+        input_files = [excel_file, pbi_file] if excel_file is not None and pbi_file is not None else []
+
+    snapshot_file = None
+    if input_format != 'pages':
+        snapshot_file = st.file_uploader(
+            "Previous run snapshot (optional)",
+            type=["zip"],
+            help="Upload the snapshot downloaded from an earlier run of this report to get a delta report of the keys that changed since."
+        )
+
+    validation_result = None
+    page_reports = None
+    source_name = uploaded_file.name if input_files else None
+    job = None
+    if input_files:
+        uploaded_names = ', '.join(file.name for file in input_files)
+        st.markdown(f'<div class="file-list"><strong>Uploaded File:</strong> {uploaded_names}</div>', unsafe_allow_html=True)
+        # Reruns with the same upload (e.g. a threshold change) reuse the cached report and only re-export
+        content_hash = get_content_hash(input_files)
+
+        if key_precheck:
+            with st.spinner("Sketching the keys..."):
+                try:
+                    with profile_stage('pre-check'):
+                        prechecks = compute_precheck(content_hash, input_format, input_files)
+                    show_precheck(prechecks, low_threshold)
+                except Exception as e:
+                    st.markdown(
+                        f'<div class="error-box">Oops! An error occurred: {str(e)}</div>',
+                        unsafe_allow_html=True
+                    )
+        elif background_job:
+            # The job id covers the upload and the options, so a rerun finds the running job instead of
+            # copying the upload and submitting it again
+            job_id = f"{content_hash}-{input_format}-{key_mode}-{int(chunked_aggregation)}-{int(encode_dims)}-{int(parallel_pages)}"
+            job = get_job(get_job_store(), job_id)
+            # A failed job stays failed, with its error shown below, until the user asks for a retry
+            retry = job is not None and job['status'] == 'failed' and st.session_state.get('retry_job', False)
+            if job is None or retry:
+                from val_core import run_validation, run_pages
+                if input_format == 'pages':
+                    job = submit_job(
+                        get_job_store(), job_id, uploaded_file.name, run_pages,
+                        key_mode, encode_dims, parallel_pages, copy_uploads(input_files)
+                    )
+                else:
+                    job = submit_job(
+                        get_job_store(), job_id, uploaded_file.name, run_validation,
+                        input_format, key_mode, chunked_aggregation, encode_dims, copy_uploads(input_files)
+                    )
+            st.query_params['job'] = job_id
+        else:
+            with st.spinner("Generating your validation report... Hang tight!"):
+                try:
+                    with profile_stage('validation'):
+                        if input_format == 'pages':
+                            page_reports = compute_pages(content_hash, key_mode, encode_dims, parallel_pages, input_files)
+                        else:
+                            validation_result = compute_validation(
+                                content_hash, input_format, key_mode, chunked_aggregation, encode_dims, input_files
+                            )
+                except Exception as e:
+                    st.markdown(
+                        f'<div class="error-box">Oops! An error occurred: {str(e)}</div>',
+                        unsafe_allow_html=True
+                    )
+    elif background_job and 'job' in st.query_params:
+        # Back from a reconnect or a shared link: the uploads are gone but the job is still on the server
+        content_hash = st.query_params['job']
+        job = get_job(get_job_store(), content_hash)
+        if job is None:
+            st.warning("That background job is no longer available. Upload the files again to rerun it.")
+
+    if job is not None:
+        if is_job_active(job):
+            show_job_progress(job['id'])
+        elif job['status'] == 'failed':
+            st.markdown(
+                f'<div class="error-box">Oops! An error occurred: {job["error"]}</div>',
+                unsafe_allow_html=True
+            )
+            if input_files:
+                st.button("Retry the job", key="retry_job")
+        else:
+            # Page jobs hand back a dict of sheet name -> report, single reports a tuple
+            if isinstance(job['result'], dict):
+                page_reports = job['result']
+            else:
+                validation_result = job['result']
+            source_name = job['label']
+
+    if page_reports is not None:
+        from val_core import get_combined_report_name, write_reports
+        try:
+            st.subheader("Validation Report Preview")
+            preview_sheet = st.selectbox("Page", list(page_reports))
+            with profile_stage('preview', rows=len(page_reports[preview_sheet])):
+                show_preview(page_reports[preview_sheet], low_threshold, preview_sheet)
+
+            # Every page goes straight into one workbook, formatted as it is written; no merge step needed
+            output = write_reports(page_reports, low_threshold, mid_threshold, format_mode, streaming_output)
+            new_file_name = get_combined_report_name(source_name)
+            st.markdown(
+                f'<div class="success-box">Success! Your combined report of {len(page_reports)} page(s) is ready: <strong>{new_file_name}</strong></div>',
+                unsafe_allow_html=True
+            )
+            st.download_button(
+                label="Download Your Validation Report!",
+                data=output,
+                file_name=new_file_name,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+            st.markdown('---')
+
+        except Exception as e:
+            st.markdown(
+                f'<div class="error-box">Oops! An error occurred: {str(e)}</div>',
+                unsafe_allow_html=True
+            )
+
+    if validation_result is not None:
+        from val_core import (
+            get_report_sheet_name, get_rollup_sheet_name, get_report_columns, write_report, write_reports, write_snapshot
+        )
+        try:
+            validation_report, column_checklist_df, diff_checker_df, excel_agg, pbi_agg = validation_result
+            original_filename = os.path.splitext(source_name)[0]
+            sheet_name = get_report_sheet_name(source_name)
+
+            # The full-detail report first, then one sheet per rolled-up level, coarsest first
+            reports = {sheet_name: validation_report}
+            if rollup_levels:
+                with profile_stage('rollups'):
+                    rollups = compute_rollups(content_hash, key_mode, chunked_aggregation, encode_dims, validation_result)
+                reports.update({get_rollup_sheet_name(level_dims): report for level_dims, report in rollups.items()})
+
+            st.subheader("Validation Report Preview")
+            preview_sheet = st.selectbox("Level", list(reports)) if len(reports) > 1 else sheet_name
+            with profile_stage('preview', rows=len(reports[preview_sheet])):
+                show_preview(reports[preview_sheet], low_threshold, preview_sheet)
+
+            output = write_reports(reports, low_threshold, mid_threshold, format_mode, streaming_output)
+            new_file_name = f"{original_filename}_validation_report.xlsx"
+            st.markdown(
+                f'<div class="success-box">Success! Your validation report is ready: <strong>{new_file_name}</strong></div>',
+                unsafe_allow_html=True
+            )
+            st.download_button(
+                label="Download Your Validation Report!",
+                data=output,
+                file_name=new_file_name,
+                mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            )
+
+            if snapshot_file is not None:
+                st.subheader("Changes Since Previous Run")
+                try:
+                    delta_report = compute_delta(
+                        content_hash, get_content_hash([snapshot_file]), key_mode, chunked_aggregation, encode_dims,
+                        validation_result, snapshot_file
+                    )
+                except ValueError as e:
+                    # A snapshot from another report still leaves this run's report and snapshot downloadable
+                    st.warning(str(e))
+                else:
+                    if delta_report.empty:
+                        st.info("No keys changed since the previous run.")
+                    else:
+                        st.write(delta_report['change'].value_counts().to_dict())
+                        st.dataframe(delta_report)
+                        delta_output = write_report(delta_report, sheet_name, low_threshold, mid_threshold, format_mode, streaming_output)
+                        st.download_button(
+                            label="Download Delta Report",
+                            data=delta_output,
+                            file_name=f"{original_filename}_delta_report.xlsx",
+                            mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                            key="download_delta"
+                        )
+
+            # Re-upload this next time to see only what changed
+            dims, all_measures = get_report_columns(validation_report)
+            st.download_button(
+                label="Download Snapshot For Next Run",
+                data=write_snapshot(excel_agg, pbi_agg, dims, all_measures),
+                file_name=f"{original_filename}_snapshot.zip",
+                mime="application/zip",
+                key="download_snapshot"
+            )
+
+            st.markdown('---')
+
+        except Exception as e:
+            st.markdown(
+                f'<div class="error-box">Oops! An error occurred: {str(e)}</div>',
+                unsafe_allow_html=True
+            )
+
+    if profile_stages:
+        show_profile(records, source_name or 'validation')
+        stop_profile()
 
     try:
         image_base64 = get_base64_image("Sigmoid_Logo.jpg")
@@ -0,0 +1,1068 @@
+import io
+import os
+import re
+import json
+import zipfile
+import itertools
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from openpyxl import Workbook, load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import PatternFill, Font, Border, Side, Alignment
+from openpyxl.formatting.rule import CellIsRule, ColorScaleRule, FormulaRule
+from openpyxl.utils import get_column_letter
+from profiling import profile_stage
+from table_io import read_table, read_table_chunks
+
+# calamine parses xlsx natively and much faster than openpyxl; it is optional, so openpyxl is the fallback
+try:
+    import python_calamine  # noqa: F401
+    EXCEL_ENGINE = 'calamine'
+except ImportError:
+    EXCEL_ENGINE = 'openpyxl'
+
+# Validation logic shared by the Streamlit app and the batch CLI; nothing here imports Streamlit
+
+# Rows per chunk when aggregating large inputs out of core
+CHUNK_SIZE = 100_000
+
+# Amber shades between the green and amber thresholds in cell-fill formatting
+AMBER_STEPS = 16
+
+# Key pre-check sketches: 2**14 HyperLogLog registers (about 1% error) and the 4096 smallest key hashes for MinHash
+HLL_PRECISION = 14
+MINHASH_SIZE = 4096
+
+def get_dims_and_measures(excel_df, pbi_df):
+    dims = [col for col in excel_df.columns if col in pbi_df.columns and 
+            (excel_df[col].dtype == 'object' or '_id' in col.lower() or '_key' in col.lower() or
+             '_ID' in col or '_KEY' in col)]
+
+    excel_measures = [col for col in excel_df.columns if col not in dims and np.issubdtype(excel_df[col].dtype, np.number)]
+    pbi_measures = [col for col in pbi_df.columns if col not in dims and np.issubdtype(pbi_df[col].dtype, np.number)]
+
+    # Keep the excel column order so both engines lay out the report identically
+    all_measures = [col for col in excel_measures if col in pbi_measures]
+
+    return dims, all_measures
+
+def compute_diff(excel_values, pbi_values):
+    excel_values = excel_values.fillna(0)
+    pbi_values = pbi_values.fillna(0)
+    return np.where(
+        (pbi_values == 0) | (excel_values == 0),
+        np.where((pbi_values == 0) & (excel_values == 0), 0, 1),
+        abs(round((pbi_values - excel_values) / excel_values, 4))
+    )
+
+def render_unique_key(df, dims):
+    unique_key = df[dims[0]].astype(str)
+    if len(dims) > 1:
+        unique_key = unique_key.str.cat([df[dim].astype(str) for dim in dims[1:]], sep='-')
+    return unique_key.str.upper()
+
+def normalize_frame(df):
+    return df.apply(lambda x: x.str.upper().str.strip() if x.dtype == "object" else x)
+
+def normalize_value(value):
+    # As the .str accessors in normalize_frame: anything in a text column that is not a string is blanked
+    return value.upper().strip() if isinstance(value, str) else None
+
+def encode_dimensions(excel_df, pbi_df, dims):
+    # Each distinct value is normalised once, and both frames share one set of category codes per dimension.
+    # The report is the same as with normalize_frame and fillna('NAN'), whatever the key mode
+    for dim in dims:
+        if excel_df[dim].dtype != pbi_df[dim].dtype:
+            # Shared codes would merge int 1 with float 1.0, which the object path keys apart in string mode,
+            # so a dimension typed differently on the two sides is left as the object path leaves it
+            for df in (excel_df, pbi_df):
+                df[dim] = normalize_frame(df[[dim]])[dim].fillna('NAN')
+            continue
+
+        values = pd.concat([excel_df[dim], pbi_df[dim]], ignore_index=True)
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        labels = pd.Series(uniques, dtype=object)
+        if values.dtype == object:
+            labels = labels.map(normalize_value)
+        if labels.hasnans:
+            labels = labels.fillna('NAN')
+        label_codes, categories = pd.factorize(labels)
+        encoded = pd.Categorical.from_codes(label_codes[codes], categories=categories)
+        excel_df[dim] = pd.Series(encoded[:len(excel_df)], index=excel_df.index)
+        pbi_df[dim] = pd.Series(encoded[len(excel_df):], index=pbi_df.index)
+
+def aggregate_frames(excel_df, pbi_df, encode_dims=False):
+    dims, all_measures = get_dims_and_measures(excel_df, pbi_df)
+
+    with profile_stage('prepare dimensions', rows=len(excel_df) + len(pbi_df)):
+        if encode_dims:
+            encode_dimensions(excel_df, pbi_df, dims)
+        else:
+            excel_df[dims] = excel_df[dims].fillna('NAN')
+            pbi_df[dims] = pbi_df[dims].fillna('NAN')
+
+    # observed=True groups on the category codes and skips combinations that never occur
+    with profile_stage('groupby', rows=len(excel_df) + len(pbi_df)):
+        excel_agg = excel_df.groupby(dims, observed=True)[all_measures].sum().reset_index()
+        pbi_agg = pbi_df.groupby(dims, observed=True)[all_measures].sum().reset_index()
+    return dims, all_measures, excel_agg, pbi_agg
+
+def generate_validation_report(excel_df, pbi_df, engine='join', key_mode='string', encode_dims=False):
+    if engine == 'legacy':
+        return generate_validation_report_legacy(excel_df, pbi_df)
+
+    dims, all_measures, excel_agg, pbi_agg = aggregate_frames(excel_df, pbi_df, encode_dims)
+
+    validation_report, excel_agg, pbi_agg = build_validation_report(excel_agg, pbi_agg, dims, all_measures, key_mode)
+    if encode_dims:
+        validation_report[dims] = validation_report[dims].astype(object).infer_objects()
+    return validation_report, excel_agg, pbi_agg
+
+def dedupe_columns(columns):
+    # Repeated headers become A, A.1, A.2, ... as in read_excel, skipping names already taken
+    counts = {}
+    deduped = []
+    for col in columns:
+        count = counts.get(col, 0)
+        while count > 0:
+            counts[col] = count + 1
+            col = f'{col}.{count}'
+            count = counts.get(col, 0)
+        deduped.append(col)
+        counts[col] = count + 1
+    return deduped
+
+def get_sheet_columns(header):
+    # Column names as read_excel gives them: blank headers are Unnamed: <position>, repeats are deduplicated
+    return dedupe_columns([name if name is not None else f'Unnamed: {idx}' for idx, name in enumerate(header)])
+
+def read_sheet_header(wb, sheet_name):
+    if sheet_name not in wb.sheetnames:
+        raise ValueError(f"Worksheet named '{sheet_name}' not found")
+    ws = wb[sheet_name]
+    ws.reset_dimensions()
+    return get_sheet_columns(next(ws.iter_rows(max_row=1, values_only=True), ()))
+
+def read_validation_sheets(source):
+    # Headers first: only columns in both sheets can become dimensions or measures, so the rest are never kept.
+    # The header rows come from a read-only openpyxl pass that stops after the first row, so each sheet is
+    # parsed in full only once (calamine parses every column but hands pandas only these).
+    # Returns the pruned frames and each sheet's full column list, for the column checklist.
+    with profile_stage('read headers'):
+        wb = load_workbook(source, read_only=True)
+        try:
+            excel_columns = read_sheet_header(wb, 'excel')
+            pbi_columns = read_sheet_header(wb, 'PBI')
+        finally:
+            wb.close()
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    xls = pd.ExcelFile(source, engine=EXCEL_ENGINE)
+
+    # Positions rather than names, so duplicate and blank headers keep the names pandas gives them
+    excel_positions = [idx for idx, col in enumerate(excel_columns) if col in pbi_columns]
+    pbi_positions = [idx for idx, col in enumerate(pbi_columns) if col in excel_columns]
+    with profile_stage('read shared columns') as stage:
+        excel_df = pd.read_excel(xls, 'excel', usecols=excel_positions)
+        pbi_df = pd.read_excel(xls, 'PBI', usecols=pbi_positions)
+        stage['rows'] = len(excel_df) + len(pbi_df)
+    return excel_df, pbi_df, excel_columns, pbi_columns
+
+def validate_page(file_bytes, key_mode='string', encode_dims=False):
+    # One report page workbook with 'excel' and 'PBI' sheets -> its validation report
+    excel_df, pbi_df, _, _ = read_validation_sheets(io.BytesIO(file_bytes))
+    if not encode_dims:
+        excel_df, pbi_df = normalize_frame(excel_df), normalize_frame(pbi_df)
+    return generate_validation_report(excel_df, pbi_df, key_mode=key_mode, encode_dims=encode_dims)[0]
+
+def validate_pages(file_bytes_list, key_mode='string', encode_dims=False, parallel=False, max_workers=None, progress=None):
+    # Reports come back in page order; progress(fraction, message) is called as each page finishes
+    if not parallel or len(file_bytes_list) < 2:
+        reports = []
+        for idx, file_bytes in enumerate(file_bytes_list):
+            with profile_stage(f'validate page {idx + 1}') as stage:
+                reports.append(validate_page(file_bytes, key_mode, encode_dims))
+                stage['rows'] = len(reports[-1])
+            if progress is not None:
+                progress((idx + 1) / len(file_bytes_list), f"Validated page {idx + 1} of {len(file_bytes_list)}")
+        return reports
+
+    if max_workers is None:
+        max_workers = min(len(file_bytes_list), os.cpu_count() or 1)
+    # spawn rather than fork: the Streamlit server process is multi-threaded
+    with ProcessPoolExecutor(max_workers=max_workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+        futures = [executor.submit(validate_page, file_bytes, key_mode, encode_dims) for file_bytes in file_bytes_list]
+        reports = []
+        for idx, future in enumerate(futures):
+            reports.append(future.result())
+            if progress is not None:
+                progress((idx + 1) / len(futures), f"Validated page {idx + 1} of {len(futures)}")
+    return reports
+
+def read_sheet_chunks(wb, sheet_name, chunk_size=CHUNK_SIZE):
+    ws = wb[sheet_name]
+    # Read-only sheets trust the stored <dimension> tag, which some exporters write as just A1
+    ws.reset_dimensions()
+    rows = ws.iter_rows(values_only=True)
+    columns = get_sheet_columns(next(rows, None) or ())
+
+    chunk = []
+    yielded = False
+    for row in rows:
+        if all(value is None for value in row):
+            continue
+        # Without a stored dimension, rows end at their last written cell, so short rows are padded
+        chunk.append(row[:len(columns)] + (None,) * (len(columns) - len(row)))
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame(chunk, columns=columns)
+            chunk = []
+            yielded = True
+    if chunk or not yielded:
+        yield pd.DataFrame(chunk, columns=columns)
+
+def prepare_chunk(chunk, dims, all_measures):
+    chunk = normalize_frame(chunk)
+    for dim in dims:
+        # Integral float ids are grouped as ints so a key does not depend on whether its chunk
+        # happened to contain a blank; aggregate_chunks renders them as the full column would
+        if pd.api.types.is_float_dtype(chunk[dim]) and (chunk[dim].dropna() % 1 == 0).all():
+            chunk[dim] = chunk[dim].astype('Int64').astype(object)
+    chunk[dims] = chunk[dims].fillna('NAN')
+    for measure in all_measures:
+        chunk[measure] = pd.to_numeric(chunk[measure], errors='coerce')
+    return chunk
+
+def aggregate_chunks(chunks, dims, all_measures):
+    # Running per-key partial sums: memory follows the number of distinct keys, not rows
+    accumulator = None
+    float_dims, object_dims = set(), set()
+    for chunk in chunks:
+        float_dims.update(dim for dim in dims if pd.api.types.is_float_dtype(chunk[dim]))
+        object_dims.update(dim for dim in dims if chunk[dim].dtype == object and chunk[dim].notna().any())
+        partial = prepare_chunk(chunk, dims, all_measures).groupby(dims)[all_measures].sum()
+        if accumulator is None:
+            accumulator = partial
+        else:
+            accumulator = pd.concat([accumulator, partial]).groupby(level=dims).sum()
+    agg = accumulator.reset_index()
+
+    # Read whole, a numeric id column is float as soon as one of its rows is blank or fractional,
+    # so keys render as 0.0 rather than 0; match that so both modes (and their snapshots) share keys
+    for dim in float_dims - object_dims:
+        agg[dim] = agg[dim].map(lambda value: value if isinstance(value, str) else float(value)).infer_objects()
+    return agg
+
+def peek_column_types(chunks):
+    # A column blank throughout a chunk reads as all-None object there and would pass for a dimension,
+    # so chunks are held back until every column has a value (or the input ends). Each column takes its
+    # dtype from the first chunk that has one; a column blank everywhere is float, as read_excel makes it.
+    # Returns an empty frame with those dtypes and the chunks, held-back ones included.
+    chunks = iter(chunks)
+    held = []
+    dtypes = {}
+    for chunk in chunks:
+        held.append(chunk)
+        for col in chunk.columns:
+            if col not in dtypes and chunk[col].notna().any():
+                dtypes[col] = chunk[col].dtype
+        if len(dtypes) == len(chunk.columns):
+            break
+    columns = held[0].columns if held else []
+    sample = pd.DataFrame({col: pd.Series(dtype=dtypes.get(col, np.float64)) for col in columns})
+    return sample, itertools.chain(held, chunks)
+
+def generate_validation_report_chunked(excel_chunks, pbi_chunks, key_mode='string'):
+    # Dimensions and measures are decided from the column types of each side's leading chunks
+    excel_sample, excel_chunks = peek_column_types(excel_chunks)
+    pbi_sample, pbi_chunks = peek_column_types(pbi_chunks)
+    dims, all_measures = get_dims_and_measures(excel_sample, pbi_sample)
+
+    with profile_stage('aggregate excel chunks'):
+        excel_agg = aggregate_chunks(excel_chunks, dims, all_measures)
+    with profile_stage('aggregate PBI chunks'):
+        pbi_agg = aggregate_chunks(pbi_chunks, dims, all_measures)
+
+    validation_report, excel_agg, pbi_agg = build_validation_report(excel_agg, pbi_agg, dims, all_measures, key_mode)
+    return validation_report, excel_agg, pbi_agg, list(excel_sample.columns), list(pbi_sample.columns)
+
+def update_hll(registers, hashes):
+    # HyperLogLog: the top bits pick a register, which keeps the longest run of leading zeros seen in the rest
+    bucket = (hashes >> np.uint64(64 - HLL_PRECISION)).astype(np.intp)
+    rest = hashes & np.uint64((1 << (64 - HLL_PRECISION)) - 1)
+    # frexp gives the bit length exactly, as the remaining bits fit in a float64 mantissa
+    _, bit_length = np.frexp(rest.astype(np.float64))
+    np.maximum.at(registers, bucket, (64 - HLL_PRECISION - bit_length + 1).astype(np.uint8))
+
+def estimate_hll(registers):
+    m = len(registers)
+    estimate = 0.7213 / (1 + 1.079 / m) * m * m / np.sum(np.ldexp(1.0, -registers.astype(np.int64)))
+    zeros = np.count_nonzero(registers == 0)
+    if estimate <= 2.5 * m and zeros:
+        # Linear counting is more accurate while many registers are still empty
+        estimate = m * np.log(m / zeros)
+    return estimate
+
+def update_minhash(sketch, hashes):
+    # Bottom-k MinHash: the MINHASH_SIZE smallest distinct key hashes seen so far
+    return np.unique(np.concatenate([sketch, hashes]))[:MINHASH_SIZE]
+
+def new_key_sketch():
+    return {'rows': 0, 'registers': np.zeros(1 << HLL_PRECISION, dtype=np.uint8), 'minhash': np.empty(0, dtype=np.uint64), 'totals': None}
+
+def update_key_sketch(sketch, chunk, dims, all_measures):
+    chunk = prepare_chunk(chunk, dims, all_measures)
+    # Hashing the rendered key matches keys the way the default joined-key report does
+    hashes = pd.util.hash_pandas_object(render_unique_key(chunk, dims), index=False).to_numpy()
+    update_hll(sketch['registers'], hashes)
+    sketch['minhash'] = update_minhash(sketch['minhash'], hashes)
+    totals = chunk[all_measures].sum()
+    sketch['totals'] = totals if sketch['totals'] is None else sketch['totals'] + totals
+    sketch['rows'] += len(chunk)
+
+def count_distinct_keys(sketch):
+    # Below MINHASH_SIZE distinct keys the MinHash sketch holds every key, so the count is exact
+    if len(sketch['minhash']) < MINHASH_SIZE:
+        return len(sketch['minhash'])
+    return estimate_hll(sketch['registers'])
+
+def estimate_key_overlap(excel_chunks, pbi_chunks):
+    # One pass over each side's chunks; memory is a few fixed-size sketches however many keys there are
+    excel_sample, excel_chunks = peek_column_types(excel_chunks)
+    pbi_sample, pbi_chunks = peek_column_types(pbi_chunks)
+    dims, all_measures = get_dims_and_measures(excel_sample, pbi_sample)
+
+    sketches = {}
+    for side, chunks in [('excel', excel_chunks), ('PBI', pbi_chunks)]:
+        sketch = new_key_sketch()
+        with profile_stage(f'sketch {side} keys') as stage:
+            for chunk in chunks:
+                update_key_sketch(sketch, chunk, dims, all_measures)
+            stage['rows'] = sketch['rows']
+        sketches[side] = sketch
+    excel_sketch, pbi_sketch = sketches['excel'], sketches['PBI']
+
+    # Jaccard similarity from the smallest hashes of the union, scaled by the HLL estimate of the union
+    union_minhash = update_minhash(excel_sketch['minhash'], pbi_sketch['minhash'])
+    in_both = np.isin(union_minhash, excel_sketch['minhash']) & np.isin(union_minhash, pbi_sketch['minhash'])
+    jaccard = in_both.mean() if len(union_minhash) else 1.0
+    union_sketch = {'registers': np.maximum(excel_sketch['registers'], pbi_sketch['registers']), 'minhash': union_minhash}
+    excel_keys, pbi_keys = count_distinct_keys(excel_sketch), count_distinct_keys(pbi_sketch)
+    shared_keys = min(jaccard * count_distinct_keys(union_sketch), excel_keys, pbi_keys)
+
+    key_summary = pd.DataFrame({
+        'Check': [
+            "Rows in excel", "Rows in PBI", "Distinct keys in excel", "Distinct keys in PBI", "Keys in both",
+            "Share of excel keys in PBI", "Share of PBI keys in excel"
+        ],
+        # Counts stay integers next to the shares
+        'Estimate': pd.Series([
+            excel_sketch['rows'], pbi_sketch['rows'], round(excel_keys), round(pbi_keys), round(shared_keys),
+            round(shared_keys / excel_keys, 4) if excel_keys else 1.0, round(shared_keys / pbi_keys, 4) if pbi_keys else 1.0
+        ], dtype=object)
+    })
+    measure_summary = pd.DataFrame({
+        'Measure': all_measures,
+        'Total excel': excel_sketch['totals'].to_numpy(),
+        'Total PBI': pbi_sketch['totals'].to_numpy()
+    })
+    measure_summary['Diff'] = compute_diff(measure_summary['Total excel'], measure_summary['Total PBI'])
+    return key_summary, measure_summary
+
+def align_dim_dtypes(excel_agg, pbi_agg, dims):
+    # A blank filled with 'NAN' on one side only leaves that side's dimension as object;
+    # tuple merges and row hashes need both sides to share a dtype
+    for dim in dims:
+        if excel_agg[dim].dtype != pbi_agg[dim].dtype:
+            excel_agg[dim] = excel_agg[dim].astype(object)
+            pbi_agg[dim] = pbi_agg[dim].astype(object)
+
+def get_dim_codes(excel_agg, pbi_agg, dims):
+    # Codes per dimension, shared by both sides; values equal in Python (1 and 1.0) get one code
+    excel_codes, pbi_codes = {}, {}
+    for dim in dims:
+        codes, _ = pd.factorize(pd.concat([excel_agg[dim], pbi_agg[dim]], ignore_index=True))
+        excel_codes[dim], pbi_codes[dim] = codes[:len(excel_agg)], codes[len(excel_agg):]
+    return pd.DataFrame(excel_codes), pd.DataFrame(pbi_codes)
+
+def sort_by_dims(frame, dims):
+    # factorize(sort=True) orders mixed ints and strings, which sort_values cannot compare
+    ranks = [pd.factorize(frame[dim], sort=True)[0] for dim in reversed(dims)]
+    return frame.iloc[np.lexsort(ranks)] if ranks else frame
+
+def build_validation_report(excel_agg, pbi_agg, dims, all_measures, key_mode='string'):
+    with profile_stage('match keys', rows=len(excel_agg) + len(pbi_agg)):
+        align_dim_dtypes(excel_agg, pbi_agg, dims)
+
+        if key_mode == 'tuple':
+            # Match on the dimension values themselves; they are never joined into a string
+            merged = pd.merge(excel_agg, pbi_agg, on=dims, how='outer', suffixes=('_excel', '_PBI'), indicator=True)
+            merged['unique_key'] = render_unique_key(merged, dims)
+        else:
+            if key_mode == 'hash':
+                # A 64-bit hash of each dimension tuple; '-' inside a value can no longer collide.
+                # Values are hashed by their code over both sides, so 1 and 1.0 match as they do in tuple mode
+                key_col = '_key_hash'
+                excel_codes, pbi_codes = get_dim_codes(excel_agg, pbi_agg, dims)
+                excel_agg[key_col] = pd.util.hash_pandas_object(excel_codes, index=False).values
+                pbi_agg[key_col] = pd.util.hash_pandas_object(pbi_codes, index=False).values
+            elif key_mode == 'string':
+                key_col = 'unique_key'
+                excel_agg[key_col] = render_unique_key(excel_agg, dims)
+                pbi_agg[key_col] = render_unique_key(pbi_agg, dims)
+            else:
+                raise ValueError(f"Unknown key mode: {key_mode}")
+
+            excel_agg = excel_agg[[key_col] + [col for col in excel_agg.columns if col != key_col]]
+            pbi_agg = pbi_agg[[key_col] + [col for col in pbi_agg.columns if col != key_col]]
+
+            # Colliding keys keep the last row, as the dict lookups of the legacy engine did
+            merged = pd.merge(
+                excel_agg.drop_duplicates(key_col, keep='last'),
+                pbi_agg.drop_duplicates(key_col, keep='last'),
+                on=key_col, how='outer', suffixes=('_excel', '_PBI'), indicator=True
+            )
+            if key_mode == 'hash':
+                # Take each dimension from the side that has the key so integer ids are not upcast before rendering
+                excel_dims = excel_agg.drop_duplicates(key_col, keep='last').set_index(key_col)[dims]
+                pbi_dims = pbi_agg.drop_duplicates(key_col, keep='last').set_index(key_col)[dims]
+                dim_source = pd.concat([excel_dims, pbi_dims[~pbi_dims.index.isin(excel_dims.index)]])
+                for dim in dims:
+                    merged[dim] = dim_source[dim].reindex(merged[key_col]).to_numpy()
+                # Hash order means nothing to a reader; sort by the dimensions, as the tuple merge does
+                merged = sort_by_dims(merged, dims)
+                merged['unique_key'] = render_unique_key(merged, dims)
+            else:
+                for dim in dims:
+                    merged[dim] = merged[f'{dim}_excel'].fillna(merged[f'{dim}_PBI'])
+
+    validation_report = merged[['unique_key'] + dims].copy()
+
+    validation_report['presence'] = merged['_merge'].map({
+        'both': 'Present in Both',
+        'left_only': 'Present in excel',
+        'right_only': 'Present in PBI'
+    }).astype(object)
+
+    with profile_stage('diffs', rows=len(merged)):
+        for measure in all_measures:
+            validation_report[f'{measure}_excel'] = merged[f'{measure}_excel']
+            validation_report[f'{measure}_PBI'] = merged[f'{measure}_PBI']
+            validation_report[f'{measure}_Diff'] = compute_diff(merged[f'{measure}_excel'], merged[f'{measure}_PBI'])
+
+    return validation_report.reset_index(drop=True), excel_agg, pbi_agg
+
+def generate_rollup_reports(excel_agg, pbi_agg, dims, all_measures, key_mode='string'):
+    # One report per dimension prefix, coarsest first: each level is summed from the level below it,
+    # starting at the fine per-key sums, so the raw rows are never scanned again
+    levels = []
+    for level in range(len(dims) - 1, 0, -1):
+        level_dims = dims[:level]
+        with profile_stage(f"rollup {' > '.join(map(str, level_dims))}", rows=len(excel_agg) + len(pbi_agg)):
+            excel_agg = excel_agg.groupby(level_dims, observed=True)[all_measures].sum().reset_index()
+            pbi_agg = pbi_agg.groupby(level_dims, observed=True)[all_measures].sum().reset_index()
+            report, excel_agg, pbi_agg = build_validation_report(excel_agg, pbi_agg, level_dims, all_measures, key_mode)
+        for dim in level_dims:
+            if isinstance(report[dim].dtype, pd.CategoricalDtype):
+                report[dim] = report[dim].astype(object).infer_objects()
+        levels.append((tuple(level_dims), report))
+    return dict(reversed(levels))
+
+def get_rollup_sheet_name(level_dims):
+    # The level number keeps truncated names unique; characters Excel rejects in sheet names are dropped
+    name = f"L{len(level_dims)} {' > '.join(map(str, level_dims))}"
+    return ''.join(char for char in name if char not in '\\/?*[]:')[:31]
+
+def generate_validation_report_legacy(excel_df, pbi_df):
+    dims, all_measures = get_dims_and_measures(excel_df, pbi_df)
+
+    excel_df[dims] = excel_df[dims].fillna('NAN')
+    pbi_df[dims] = pbi_df[dims].fillna('NAN')
+
+    excel_agg = excel_df.groupby(dims)[all_measures].sum().reset_index()
+    pbi_agg = pbi_df.groupby(dims)[all_measures].sum().reset_index()
+
+    excel_agg['unique_key'] = excel_agg[dims].astype(str).agg('-'.join, axis=1).str.upper()
+    pbi_agg['unique_key'] = pbi_agg[dims].astype(str).agg('-'.join, axis=1).str.upper()
+
+    excel_agg = excel_agg[['unique_key'] + [col for col in excel_agg.columns if col != 'unique_key']]
+    pbi_agg = pbi_agg[['unique_key'] + [col for col in pbi_agg.columns if col != 'unique_key']]
+
+    validation_report = pd.DataFrame({'unique_key': list(set(excel_agg['unique_key']) | set(pbi_agg['unique_key']))})
+
+    for dim in dims:
+        validation_report[dim] = validation_report['unique_key'].map(dict(zip(excel_agg['unique_key'], excel_agg[dim])))
+        validation_report[dim].fillna(validation_report['unique_key'].map(dict(zip(pbi_agg['unique_key'], pbi_agg[dim]))), inplace=True)
+
+    validation_report['presence'] = validation_report['unique_key'].apply(
+        lambda key: 'Present in Both' if key in excel_agg['unique_key'].values and key in pbi_agg['unique_key'].values
+        else ('Present in excel' if key in excel_agg['unique_key'].values
+              else 'Present in PBI')
+    )
+
+    for measure in all_measures:
+        validation_report[f'{measure}_excel'] = validation_report['unique_key'].map(dict(zip(excel_agg['unique_key'], excel_agg[measure])))
+        validation_report[f'{measure}_PBI'] = validation_report['unique_key'].map(dict(zip(pbi_agg['unique_key'], pbi_agg[measure])))
+        
+        validation_report[f'{measure}_Diff'] = np.where(
+            (validation_report[f'{measure}_PBI'].fillna(0) == 0) | (validation_report[f'{measure}_excel'].fillna(0) == 0),
+            np.where(
+                (validation_report[f'{measure}_PBI'].fillna(0) == 0) & (validation_report[f'{measure}_excel'].fillna(0) == 0),
+                0,
+                1
+            ),
+            abs(round((validation_report[f'{measure}_PBI'].fillna(0) - validation_report[f'{measure}_excel'].fillna(0)) / 
+                     validation_report[f'{measure}_excel'].fillna(0), 4))
+        )
+
+    column_order = ['unique_key'] + dims + ['presence'] + \
+                   [col for measure in all_measures for col in 
+                    [f'{measure}_excel', f'{measure}_PBI', f'{measure}_Diff']]
+    validation_report = validation_report[column_order]
+
+    return validation_report, excel_agg, pbi_agg
+
+def column_checklist(excel_df, pbi_df):
+    excel_columns = excel_df.columns.tolist()
+    pbi_columns = pbi_df.columns.tolist()
+
+    checklist_df = pd.DataFrame({
+        'excel Columns': excel_columns + [''] * (max(len(pbi_columns), len(excel_columns)) - len(excel_columns)),
+        'PowerBI Columns': pbi_columns + [''] * (max(len(pbi_columns), len(excel_columns)) - len(pbi_columns))
+    })
+
+    checklist_df['Match'] = checklist_df.apply(lambda row: row['excel Columns'] == row['PowerBI Columns'], axis=1)
+    
+    return checklist_df
+
+def generate_diff_checker(validation_report):
+    diff_columns = [col for col in validation_report.columns if col.endswith('_Diff')]
+
+    diff_checker = pd.DataFrame({
+        'Diff Column Name': diff_columns,
+        'Percentage Difference': [f"{validation_report[col].mean()*100:.2f}%" for col in diff_columns]
+    })
+
+    presence_summary = {
+        'Diff Column Name': 'All rows present in both',
+        'Percentage Difference': 'Yes' if all(validation_report['presence'] == 'Present in Both') else 'No'
+    }
+    diff_checker = pd.concat([diff_checker, pd.DataFrame([presence_summary])], ignore_index=True)
+
+    return diff_checker
+
+def generate_diff_summary(excel_agg, pbi_agg, dims, all_measures, low_thresh, failure_budget=None):
+    # Gating without the wide report: keys are matched by hash and each measure is checked on its own.
+    # Once more than failure_budget keys have failed, the remaining measures are not checked
+    align_dim_dtypes(excel_agg, pbi_agg, dims)
+    excel_keys = get_key_hashes(excel_agg, dims)
+    pbi_keys = pd.Index(get_key_hashes(pbi_agg, dims))
+    pbi_pos = pbi_keys.get_indexer(excel_keys)
+    matched = pbi_pos >= 0
+    pbi_only = np.ones(len(pbi_keys), dtype=bool)
+    pbi_only[pbi_pos[matched]] = False
+
+    rows = []
+    # One flag per key (excel keys, then PBI-only keys), so a key failing several measures counts once
+    failed = np.zeros(len(excel_keys) + int(pbi_only.sum()), dtype=bool)
+    for measure in all_measures:
+        if failure_budget is not None and failed.sum() > failure_budget:
+            rows.append({'Diff Column Name': f'{measure}_Diff', 'Mismatches': None, 'Max Diff': None, 'Status': 'Not checked'})
+            continue
+
+        pbi_values = pbi_agg[measure].to_numpy(dtype=float)
+        excel_side = compute_diff(
+            pd.Series(excel_agg[measure].to_numpy(dtype=float)),
+            pd.Series(np.where(matched, pbi_values[np.where(matched, pbi_pos, 0)], np.nan))
+        )
+        # A key only in PBI differs by 100% unless its value is zero
+        pbi_side = np.where(np.nan_to_num(pbi_values[pbi_only]) == 0, 0, 1)
+        diffs = np.concatenate([excel_side, pbi_side])
+
+        mismatched = diffs > low_thresh
+        failed |= mismatched
+        mismatches = int(mismatched.sum())
+        rows.append({
+            'Diff Column Name': f'{measure}_Diff',
+            'Mismatches': mismatches,
+            'Max Diff': float(diffs.max()) if len(diffs) else 0.0,
+            'Status': 'Pass' if mismatches == 0 else 'Fail'
+        })
+
+    one_sided = int((~matched).sum() + pbi_only.sum())
+    rows.append({
+        'Diff Column Name': 'All rows present in both',
+        'Mismatches': one_sided,
+        'Max Diff': None,
+        'Status': 'Pass' if one_sided == 0 else 'Fail'
+    })
+    return pd.DataFrame(rows).astype({'Mismatches': 'Int64'})
+
+# Snapshot of a run's per-key aggregates, re-uploaded later to report only what changed since then
+SNAPSHOT_VERSION = 1
+
+def get_report_columns(validation_report):
+    columns = list(validation_report.columns)
+    dims = columns[columns.index('unique_key') + 1:columns.index('presence')]
+    all_measures = [col[:-len('_Diff')] for col in columns if col.endswith('_Diff')]
+    return dims, all_measures
+
+def get_key_hashes(agg, dims):
+    return pd.util.hash_pandas_object(agg[dims].astype(object), index=False).to_numpy()
+
+def make_snapshot_side(agg, dims, all_measures):
+    # Keys are stored as 64-bit hashes of the dimension values, so mixed-type dimensions need no schema
+    side = agg[all_measures].reset_index(drop=True)
+    side.insert(0, 'unique_key', render_unique_key(agg, dims).to_numpy())
+    side.insert(0, 'key_hash', get_key_hashes(agg, dims))
+    return side
+
+def write_snapshot(excel_agg, pbi_agg, dims, all_measures):
+    output = io.BytesIO()
+    meta = {'version': SNAPSHOT_VERSION, 'dims': dims, 'measures': all_measures}
+    with zipfile.ZipFile(output, 'w', compression=zipfile.ZIP_STORED) as archive:
+        archive.writestr('meta.json', json.dumps(meta))
+        for side, agg in [('excel', excel_agg), ('PBI', pbi_agg)]:
+            buffer = io.BytesIO()
+            make_snapshot_side(agg, dims, all_measures).to_parquet(buffer, index=False, compression='zstd')
+            archive.writestr(f'{side}.parquet', buffer.getvalue())
+    output.seek(0)
+    return output
+
+def read_snapshot(source):
+    try:
+        with zipfile.ZipFile(source) as archive:
+            meta = json.loads(archive.read('meta.json'))
+            if meta.get('version') != SNAPSHOT_VERSION:
+                raise ValueError(f"Unsupported snapshot version: {meta.get('version')}")
+            sides = {side: pd.read_parquet(io.BytesIO(archive.read(f'{side}.parquet'))) for side in ['excel', 'PBI']}
+    except (zipfile.BadZipFile, KeyError) as e:
+        raise ValueError(f"Not a validation snapshot: {e}")
+    return meta, sides['excel'], sides['PBI']
+
+def find_changed_keys(side, previous_side, all_measures):
+    previous_side = previous_side.reindex(columns=['key_hash', 'unique_key'] + all_measures)
+    merged = pd.merge(side, previous_side, on='key_hash', how='outer', suffixes=('', '_previous'), indicator=True)
+    changed = merged['_merge'] == 'left_only'
+    for measure in all_measures:
+        current, previous = merged[measure], merged[f'{measure}_previous']
+        changed |= (merged['_merge'] == 'both') & (current != previous) & ~(current.isna() & previous.isna())
+
+    removed = merged.loc[merged['_merge'] == 'right_only', ['key_hash', 'unique_key_previous']]
+    return merged.loc[changed, 'key_hash'], removed.rename(columns={'unique_key_previous': 'unique_key'})
+
+def generate_delta_report(excel_agg, pbi_agg, dims, all_measures, snapshot, key_mode='string'):
+    meta, previous_excel, previous_pbi = snapshot
+    # Keys are hashed from the dimensions in order, so a snapshot from other columns would mark every key changed
+    if meta['dims'] != dims or meta['measures'] != all_measures:
+        raise ValueError(
+            f"Snapshot columns do not match this run: the snapshot has dimensions {meta['dims']} and measures "
+            f"{meta['measures']}, this run has dimensions {dims} and measures {all_measures}"
+        )
+    excel_side = make_snapshot_side(excel_agg, dims, all_measures)
+    pbi_side = make_snapshot_side(pbi_agg, dims, all_measures)
+
+    excel_changed, excel_removed = find_changed_keys(excel_side, previous_excel, all_measures)
+    pbi_changed, pbi_removed = find_changed_keys(pbi_side, previous_pbi, all_measures)
+
+    # A key gone from one side but still on the other has changed presence and _Diff, so it is rebuilt;
+    # only keys gone from both sides are reported as removed
+    current_hashes = pd.concat([excel_side['key_hash'], pbi_side['key_hash']])
+    removed = pd.concat([excel_removed, pbi_removed]).drop_duplicates('key_hash')
+    one_sided = removed['key_hash'].isin(current_hashes)
+    changed = pd.Index(excel_changed).union(pd.Index(pbi_changed)).union(pd.Index(removed.loc[one_sided, 'key_hash']))
+    removed = removed[~one_sided]
+
+    # Only the rows of changed keys are rebuilt, from both sides so presence and _Diff stay correct
+    excel_rows = excel_agg.loc[excel_side['key_hash'].isin(changed).to_numpy(), dims + all_measures]
+    pbi_rows = pbi_agg.loc[pbi_side['key_hash'].isin(changed).to_numpy(), dims + all_measures]
+    delta_report, _, _ = build_validation_report(excel_rows.copy(), pbi_rows.copy(), dims, all_measures, key_mode)
+
+    previous_keys = pd.concat([previous_excel['unique_key'], previous_pbi['unique_key']])
+    delta_report.insert(0, 'change', np.where(delta_report['unique_key'].isin(previous_keys), 'Changed', 'Added'))
+
+    # Keys gone from both sides only have their previous rendered key to show
+    if removed.empty:
+        return delta_report.reset_index(drop=True)
+
+    removed_rows = pd.DataFrame({'change': 'Removed', 'unique_key': removed['unique_key'].to_numpy()})
+    if delta_report.empty:
+        return removed_rows.reindex(columns=delta_report.columns)
+    return pd.concat([delta_report, removed_rows], ignore_index=True)
+
+def get_row_severity(validation_report):
+    diff_columns = [col for col in validation_report.columns if col.endswith('_Diff')]
+    if not diff_columns:
+        return np.zeros(len(validation_report))
+    return np.nan_to_num(validation_report[diff_columns].to_numpy(dtype=float), nan=0.0).max(axis=1)
+
+def select_preview_rows(validation_report, low_thresh, non_green_only=False, mismatches_first=False):
+    # Row positions for the preview; only the page being shown is ever sliced out of the report
+    severity = get_row_severity(validation_report)
+    positions = np.arange(len(validation_report))
+    if non_green_only:
+        non_green = (severity > low_thresh) | (validation_report['presence'] != 'Present in Both').to_numpy()
+        positions = positions[non_green]
+    if mismatches_first:
+        positions = positions[np.argsort(-severity[positions], kind='stable')]
+    return positions
+
+def get_preview_page(validation_report, positions, page, page_size):
+    return validation_report.iloc[positions[page * page_size:(page + 1) * page_size]]
+
+def get_amber_color(value, low_thresh, mid_thresh):
+    # Snapped to a fixed palette so a report carries at most AMBER_STEPS amber styles, not one per distinct Diff
+    ratio = round((value - low_thresh) / (mid_thresh - low_thresh) * (AMBER_STEPS - 1)) / (AMBER_STEPS - 1)
+    r = int(255 + (139 - 255) * ratio)
+    g = int(255 - (255 - 0) * ratio)
+    b = 0
+    return f'{r:02X}{g:02X}{b:02X}'
+
+def make_report_fills():
+    # Green and red are fixed; amber fills are added per distinct colour by get_diff_fill
+    return {
+        'green': PatternFill(start_color='19D119', end_color='19D119', fill_type='solid'),
+        'red': PatternFill(start_color='E82D1C', end_color='E82D1C', fill_type='solid')
+    }
+
+def make_palette_fills():
+    # Every fill get_diff_fill can hand out: green and red, then each amber step in order
+    fills = make_report_fills()
+    for step in range(AMBER_STEPS):
+        color = get_amber_color(step, 0, AMBER_STEPS - 1)
+        fills[color] = PatternFill(start_color=color, end_color=color, fill_type='solid')
+    return fills
+
+def get_diff_fill(value, low_thresh, mid_thresh, fills):
+    if value <= low_thresh:
+        return fills['green']
+    if value <= mid_thresh:
+        color = get_amber_color(value, low_thresh, mid_thresh)
+        if color not in fills:
+            fills[color] = PatternFill(start_color=color, end_color=color, fill_type='solid')
+        return fills[color]
+    return fills['red']
+
+def get_presence_fill(value, fills):
+    if value == 'Present in Both':
+        return fills['green']
+    if value in ['Present in excel', 'Present in PBI']:
+        return fills['red']
+    return None
+
+def apply_conditional_formatting(ws, validation_report, low_thresh, mid_thresh, mode='cells'):
+    if mode == 'rules':
+        return apply_conditional_formatting_rules(ws, validation_report, low_thresh, mid_thresh)
+
+    fills = make_report_fills()
+    presence_col_idx = validation_report.columns.get_loc('presence') + 1
+    
+    for col_idx, col_name in enumerate(validation_report.columns, 1):
+        if col_name.endswith('_Diff'):
+            ws.cell(row=1, column=col_idx).number_format = '0.00%'
+            
+            for row_idx, value in enumerate(validation_report[col_name], 2):
+                if pd.notna(value):
+                    cell = ws.cell(row=row_idx, column=col_idx, value=value)
+                    cell.number_format = '0.00%'
+                    cell.fill = get_diff_fill(value, low_thresh, mid_thresh, fills)
+        
+        elif col_idx == presence_col_idx:
+            for row_idx, value in enumerate(validation_report[col_name], 2):
+                fill = get_presence_fill(value, fills)
+                if fill is not None:
+                    ws.cell(row=row_idx, column=col_idx).fill = fill
+
+def apply_conditional_formatting_rules(ws, validation_report, low_thresh, mid_thresh):
+    last_row = len(validation_report) + 1
+
+    for col_idx, col_name in enumerate(validation_report.columns, 1):
+        if col_name.endswith('_Diff'):
+            ws.cell(row=1, column=col_idx).number_format = '0.00%'
+            for (cell,) in ws.iter_rows(min_row=2, max_row=last_row, min_col=col_idx, max_col=col_idx):
+                if cell.value is not None:
+                    cell.number_format = '0.00%'
+
+    add_conditional_format_rules(ws, validation_report.columns, last_row, low_thresh, mid_thresh)
+
+def add_conditional_format_rules(ws, columns, last_row, low_thresh, mid_thresh):
+    fills = make_report_fills()
+    if last_row < 2:
+        return
+
+    for col_idx, col_name in enumerate(columns, 1):
+        col_letter = get_column_letter(col_idx)
+        cell_range = f'{col_letter}2:{col_letter}{last_row}'
+        first_cell = f'{col_letter}2'
+
+        if col_name.endswith('_Diff'):
+            # Green and red stop evaluation, so the colour scale only paints the amber band.
+            # ISNUMBER keeps blank (NaN) cells unfilled, as in the per-cell mode.
+            ws.conditional_formatting.add(cell_range, FormulaRule(
+                formula=[f'AND(ISNUMBER({first_cell}),{first_cell}<={low_thresh})'],
+                fill=fills['green'], stopIfTrue=True
+            ))
+            ws.conditional_formatting.add(cell_range, FormulaRule(
+                formula=[f'AND(ISNUMBER({first_cell}),{first_cell}>{mid_thresh})'],
+                fill=fills['red'], stopIfTrue=True
+            ))
+            ws.conditional_formatting.add(cell_range, ColorScaleRule(
+                start_type='num', start_value=low_thresh, start_color='FFFF00',
+                end_type='num', end_value=mid_thresh, end_color='8B0000'
+            ))
+
+        elif col_name == 'presence':
+            ws.conditional_formatting.add(cell_range, CellIsRule(
+                operator='equal', formula=['"Present in Both"'], fill=fills['green']
+            ))
+            ws.conditional_formatting.add(cell_range, FormulaRule(
+                formula=[f'OR({first_cell}="Present in excel",{first_cell}="Present in PBI")'],
+                fill=fills['red']
+            ))
+
+def write_report_sheet_streaming(wb, validation_report, sheet_name, low_thresh, mid_thresh, mode, fills):
+    ws = wb.create_sheet(title=sheet_name)
+
+    header_font = Font(bold=True)
+    header_border = Border(left=Side(style='thin'), right=Side(style='thin'), top=Side(style='thin'), bottom=Side(style='thin'))
+    header_alignment = Alignment(horizontal='center', vertical='top')
+
+    columns = list(validation_report.columns)
+    diff_idx = [idx for idx, col_name in enumerate(columns) if col_name.endswith('_Diff')]
+    presence_idx = columns.index('presence')
+
+    header = []
+    for col_idx, col_name in enumerate(columns):
+        cell = WriteOnlyCell(ws, value=col_name)
+        cell.font = header_font
+        cell.border = header_border
+        cell.alignment = header_alignment
+        if col_idx in diff_idx:
+            cell.number_format = '0.00%'
+        header.append(cell)
+    ws.append(header)
+
+    for values in validation_report.itertuples(index=False, name=None):
+        row = [None if pd.isna(value) else value for value in values]
+        for col_idx in diff_idx:
+            value = row[col_idx]
+            if value is not None:
+                cell = WriteOnlyCell(ws, value=value)
+                cell.number_format = '0.00%'
+                if mode == 'cells':
+                    cell.fill = get_diff_fill(value, low_thresh, mid_thresh, fills)
+                row[col_idx] = cell
+        if mode == 'cells':
+            fill = get_presence_fill(row[presence_idx], fills)
+            if fill is not None:
+                cell = WriteOnlyCell(ws, value=row[presence_idx])
+                cell.fill = fill
+                row[presence_idx] = cell
+        ws.append(row)
+
+    if mode == 'rules':
+        add_conditional_format_rules(ws, columns, len(validation_report) + 1, low_thresh, mid_thresh)
+
+def write_reports_streaming(reports, low_thresh, mid_thresh, mode='cells'):
+    # Write-only workbook: each row is serialised as it is appended, with its styles inline
+    output = io.BytesIO()
+    wb = Workbook(write_only=True)
+    fills = make_report_fills()
+    for sheet_name, validation_report in reports.items():
+        write_report_sheet_streaming(wb, validation_report, sheet_name, low_thresh, mid_thresh, mode, fills)
+    wb.save(output)
+    output.seek(0)
+    return output
+
+def write_report_streaming(validation_report, sheet_name, low_thresh, mid_thresh, mode='cells'):
+    return write_reports_streaming({sheet_name: validation_report}, low_thresh, mid_thresh, mode)
+
+INLINE_STRING_CELL = re.compile(rb'<c ([^>]*?)t="inlineStr"([^>]*)><is><t(?: xml:space="preserve")?>([^<]*)</t></is></c>')
+SHARED_STRINGS_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml'
+SHARED_STRINGS_REL = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings'
+
+def share_strings(output, chunk_size=1 << 20):
+    # openpyxl writes every string inline in its cell. Moving them to one shared table stores each distinct
+    # string once per workbook, which shrinks multi-sheet reports and makes them faster to open in Excel.
+    # Sheets are rewritten a block of whole rows at a time, so only the distinct strings are held in memory.
+    strings = {}
+    def to_shared(match):
+        index = strings.setdefault(match.group(3), len(strings))
+        return b'<c %st="s"%s><v>%d</v></c>' % (match.group(1), match.group(2), index)
+
+    compacted = io.BytesIO()
+    with zipfile.ZipFile(output) as source_zip:
+        if 'xl/sharedStrings.xml' in source_zip.namelist():
+            output.seek(0)
+            return output
+        with zipfile.ZipFile(compacted, 'w', zipfile.ZIP_DEFLATED) as target_zip:
+            for name in source_zip.namelist():
+                if not (name.startswith('xl/worksheets/') and name.endswith('.xml')):
+                    continue
+                with source_zip.open(name) as source, target_zip.open(name, 'w') as target:
+                    pending = b''
+                    while True:
+                        block = source.read(chunk_size)
+                        if not block:
+                            target.write(INLINE_STRING_CELL.sub(to_shared, pending))
+                            break
+                        data = pending + block
+                        # A cell never spans a row end, so each block is cut after its last complete row
+                        cut = data.rfind(b'</row>')
+                        if cut == -1:
+                            pending = data
+                            continue
+                        cut += len(b'</row>')
+                        target.write(INLINE_STRING_CELL.sub(to_shared, data[:cut]))
+                        pending = data[cut:]
+
+            with target_zip.open('xl/sharedStrings.xml', 'w') as target:
+                target.write(b'<sst xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" uniqueCount="%d">' % len(strings))
+                for text in strings:
+                    target.write(b'<si><t xml:space="preserve">%s</t></si>' % text)
+                target.write(b'</sst>')
+
+            for name in source_zip.namelist():
+                if name.startswith('xl/worksheets/') and name.endswith('.xml'):
+                    continue
+                data = source_zip.read(name)
+                if name == '[Content_Types].xml':
+                    data = data.replace(b'</Types>', f'<Override PartName="/xl/sharedStrings.xml" ContentType="{SHARED_STRINGS_TYPE}" /></Types>'.encode())
+                elif name == 'xl/_rels/workbook.xml.rels':
+                    data = data.replace(b'</Relationships>', f'<Relationship Type="{SHARED_STRINGS_REL}" Target="sharedStrings.xml" Id="rIdSharedStrings" /></Relationships>'.encode())
+                target_zip.writestr(name, data)
+    compacted.seek(0)
+    return compacted
+
+def get_report_sheet_name(filename):
+    original_filename = os.path.splitext(os.path.basename(filename))[0]
+    sheet_name = f"{original_filename}_validation_report"
+    if len(sheet_name) > 31:
+        sheet_name = sheet_name[:31]
+    return sheet_name
+
+def get_report_sheet_names(filenames):
+    # Truncated names can collide, so repeats get a numeric suffix the way the merger names duplicate sheets
+    sheet_names = []
+    for filename in filenames:
+        sheet_name = get_report_sheet_name(filename)
+        suffix = 0
+        while sheet_name in sheet_names:
+            suffix += 1
+            sheet_name = f"{get_report_sheet_name(filename)[:31 - len(str(suffix)) - 1]}_{suffix}"
+        sheet_names.append(sheet_name)
+    return sheet_names
+
+def get_combined_report_name(filename):
+    # Named after the first page's prefix before its first underscore, e.g. 'Retail_page0.xlsx' -> 'Retail_validation_report.xlsx'
+    base_name = os.path.splitext(os.path.basename(filename))[0].split('_')[0]
+    return f"{base_name}_validation_report.xlsx"
+
+def write_reports(reports, low_thresh, mid_thresh, mode='cells', streaming=False):
+    # reports maps sheet name -> validation report; every sheet is formatted as it is written
+    rows = sum(len(validation_report) for validation_report in reports.values())
+    if streaming:
+        with profile_stage('write streaming', rows=rows):
+            output = write_reports_streaming(reports, low_thresh, mid_thresh, mode)
+    else:
+        output = io.BytesIO()
+        # The parent stage also covers saving the workbook when the writer closes
+        with profile_stage('write report', rows=rows):
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                for sheet_name, validation_report in reports.items():
+                    with profile_stage('to_excel', rows=len(validation_report)):
+                        validation_report.to_excel(writer, sheet_name=sheet_name, index=False)
+                    ws = writer.sheets[sheet_name]
+                    with profile_stage('formatting', rows=len(validation_report)):
+                        apply_conditional_formatting(ws, validation_report, low_thresh, mid_thresh, mode)
+        output.seek(0)
+
+    # Only sheets that repeat each other's keys and labels (page and rollup sheets) gain from sharing;
+    # in a single report nearly every string is a distinct unique_key, so re-zipping it only costs time
+    if len(reports) < 2:
+        return output
+    with profile_stage('share strings', rows=rows):
+        return share_strings(output)
+
+def write_report(validation_report, sheet_name, low_thresh, mid_thresh, mode='cells', streaming=False):
+    return write_reports({sheet_name: validation_report}, low_thresh, mid_thresh, mode, streaming)
+
+# Input loading and report runs for val.py, kept here so the app imports them only once a file is uploaded
+
+def read_input_frames(input_format, input_files):
+    # Workbooks are read with only the columns both sheets share; the full column lists feed the checklist
+    for file in input_files:
+        file.seek(0)
+    with profile_stage('read input') as stage:
+        if input_format == 'workbook':
+            excel_df, pbi_df, excel_columns, pbi_columns = read_validation_sheets(input_files[0])
+        else:
+            excel_df = read_table(input_files[0])
+            pbi_df = read_table(input_files[1])
+            excel_columns, pbi_columns = excel_df.columns.tolist(), pbi_df.columns.tolist()
+        stage['rows'] = len(excel_df) + len(pbi_df)
+
+    return excel_df, pbi_df, excel_columns, pbi_columns
+
+def read_input_chunks(input_format, input_files):
+    # The caller closes the returned workbook (None for paired files) once the chunks are consumed
+    for file in input_files:
+        file.seek(0)
+    if input_format == 'paired':
+        return read_table_chunks(input_files[0], CHUNK_SIZE), read_table_chunks(input_files[1], CHUNK_SIZE), None
+    wb = load_workbook(input_files[0], read_only=True)
+    return read_sheet_chunks(wb, 'excel'), read_sheet_chunks(wb, 'PBI'), wb
+
+def run_validation(input_format, key_mode, chunked, encode_dims, input_files, frames=None, progress=None):
+    # Runs off the script thread for background jobs; progress(fraction, message) is optional
+    if progress is None:
+        progress = lambda fraction, message='': None
+    if chunked:
+        progress(0.05, "Aggregating chunks")
+        excel_chunks, pbi_chunks, wb = read_input_chunks(input_format, input_files)
+        try:
+            validation_report, excel_agg, pbi_agg, excel_columns, pbi_columns = generate_validation_report_chunked(
+                excel_chunks, pbi_chunks, key_mode=key_mode
+            )
+        finally:
+            if wb is not None:
+                wb.close()
+    else:
+        progress(0.05, "Reading input")
+        if frames is None:
+            frames = read_input_frames(input_format, input_files)
+        excel_df, pbi_df, excel_columns, pbi_columns = frames
+        progress(0.4, "Matching keys")
+        # The cached frames are shared across reruns, so the report works on copies (normalize_frame returns new frames)
+        if encode_dims:
+            excel_df, pbi_df = excel_df.copy(), pbi_df.copy()
+        else:
+            with profile_stage('normalise text', rows=len(excel_df) + len(pbi_df)):
+                excel_df, pbi_df = normalize_frame(excel_df), normalize_frame(pbi_df)
+        validation_report, excel_agg, pbi_agg = generate_validation_report(excel_df, pbi_df, key_mode=key_mode, encode_dims=encode_dims)
+
+    column_checklist_df = column_checklist(pd.DataFrame(columns=excel_columns), pd.DataFrame(columns=pbi_columns))
+
+    progress(0.9, "Building the diff checker")
+    with profile_stage('diff checker', rows=len(validation_report)):
+        diff_checker_df = generate_diff_checker(validation_report)
+    return validation_report, column_checklist_df, diff_checker_df, excel_agg, pbi_agg
+
+def run_pages(key_mode, encode_dims, parallel, input_files, progress=None):
+    # Sheet name -> validation report, in upload order, for one combined workbook
+    reports = validate_pages([file.getvalue() for file in input_files], key_mode, encode_dims, parallel, progress=progress)
+    return dict(zip(get_report_sheet_names([file.name for file in input_files]), reports))
+
+def precheck_inputs(input_format, input_files):
+    # (name, key summary, measure summary) per page; paired files are one page
+    pages = [input_files] if input_format == 'paired' else [[file] for file in input_files]
+    prechecks = []
+    for page_files in pages:
+        excel_chunks, pbi_chunks, wb = read_input_chunks(input_format, page_files)
+        try:
+            prechecks.append((page_files[0].name,) + estimate_key_overlap(excel_chunks, pbi_chunks))
+        finally:
+            if wb is not None:
+                wb.close()
+    return prechecks